@@ -0,0 +1,246 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swagg.py
+# version 1.0
+#
+
+import argparse
+import random
+import time
+from collections import Counter
+from operator import itemgetter
+
+# Cluster wide totals of the jobs: cpus and gpus allocated per user,
+# partition and node, and jobs per state. An allocation is cpus and gpus
+# packed in a single integer, cpus << 32 | gpus, so one addition sums both
+# and taking a job back is a subtraction.
+#
+# A full load (first refresh, a new collector snapshot, a federation
+# refresh) lays the running jobs out as columns, one entry per job for
+# users and partitions and one row per node, and reduces every key column
+# against its allocation column in a single pass. Between loads the store
+# diff (see swstore.JobStore.apply) goes through the same sums job by job,
+# so a refresh costs the jobs that changed.
+
+STATES = ['RUNNING', 'PENDING']
+SHIFT = 32
+MASK = (1 << SHIFT) - 1
+
+def pack(cpus, gpus):
+    return cpus << SHIFT | gpus
+
+def unpack(alloc):
+    return alloc >> SHIFT, alloc & MASK
+
+# Sums of a column of packed allocations per key
+def reduce_by(keys, allocs):
+    sums = {}
+    get = sums.get
+    for k, a in zip(keys, allocs):
+        sums[k] = get(k, 0) + a
+    return {k: a for k, a in sums.items() if a != 0}
+
+def add_to(sums, name, alloc):
+    a = sums.get(name, 0) + alloc
+    if a == 0:
+        sums.pop(name, None)
+    else:
+        sums[name] = a
+
+
+class JobTotals:
+
+    def __init__(self):
+        self.jobs = {}
+        self.users = {}
+        self.partitions = {}
+        self.nodes = {}
+        self.states = {state: 0 for state in STATES}
+
+    def __len__(self):
+        return len(self.jobs)
+
+    # Replaces the whole content, jobid_info as built by
+    # swqueue.process_jobs (cpus per node, gpus for the whole job)
+    def load(self, jobid_info):
+        self.jobs = dict(jobid_info)
+        self.states = {state: 0 for state in STATES}
+        self.states.update(Counter(map(itemgetter('state'), jobid_info.values())))
+        run = [job for job in jobid_info.values() if job['state'] == 'RUNNING' and len(job['nodes']) > 0]
+        allocs = [(job['cpus'] * len(job['nodes'])) << SHIFT | job['gpus'] for job in run]
+        self.users = reduce_by([job['users'][0] for job in run], allocs)
+        self.partitions = reduce_by([job.get('partition', "") for job in run], allocs)
+        row_allocs = [job['cpus'] << SHIFT | job['gpus'] // len(job['nodes']) for job in run]
+        self.nodes = reduce_by([n for job in run for n in job['nodes']],
+                               [a for job, a in zip(run, row_allocs) for n in job['nodes']])
+
+    # Adds (sign 1) or takes back (sign -1) a jobid_info entry
+    def count(self, job, sign):
+        self.states[job['state']] = self.states.get(job['state'], 0) + sign
+        nodes = job['nodes']
+        if job['state'] != 'RUNNING' or len(nodes) == 0:
+            return
+        alloc = sign * pack(job['cpus'] * len(nodes), job['gpus'])
+        add_to(self.users, job['users'][0], alloc)
+        add_to(self.partitions, job.get('partition', ""), alloc)
+        alloc = sign * pack(job['cpus'], job['gpus'] // len(nodes))
+        for n in nodes:
+            add_to(self.nodes, n, alloc)
+
+    def add_job(self, jobid, job):
+        if jobid in self.jobs:
+            self.remove_job(jobid)
+        self.jobs[jobid] = job
+        self.count(job, 1)
+
+    def remove_job(self, jobid):
+        self.count(self.jobs.pop(jobid), -1)
+
+    # Allocated (cpus, gpus) per node, user or partition
+    def node_totals(self):
+        return {name: unpack(a) for name, a in self.nodes.items()}
+
+    def user_totals(self):
+        return {name: unpack(a) for name, a in self.users.items()}
+
+    def partition_totals(self):
+        return {name: unpack(a) for name, a in self.partitions.items()}
+
+    # Number of jobs per state
+    def state_counts(self):
+        return dict(self.states)
+
+    # Number of nodes per cpu load bucket, bucket b holding the nodes with
+    # b*100/buckets % up to (b+1)*100/buckets % of their cpus allocated
+    def load_histogram(self, capacity, buckets=10):
+        hist = [0] * buckets
+        for name, tot_cpu in capacity.items():
+            used = self.nodes.get(name, 0) >> SHIFT
+            hist[min(used * buckets // max(tot_cpu, 1), buckets - 1)] += 1
+        return hist
+
+
+# Totals of a whole jobid_info as built by swqueue.process_jobs
+def from_jobid_info(jobid_info):
+    totals = JobTotals()
+    totals.load(jobid_info)
+    return totals
+
+def format_summary(totals, capacity):
+    lines = ["{:<12} {:>8} {:>8}".format("PARTITION", "CPUS", "GPUS")]
+    for name, (cpus, gpus) in sorted(totals.partition_totals().items()):
+        lines.append("{:<12} {:>8} {:>8}".format(name, cpus, gpus))
+    lines.append("")
+    lines.append("{:<12} {:>8} {:>8}".format("USER", "CPUS", "GPUS"))
+    for name, (cpus, gpus) in sorted(totals.user_totals().items(), key=lambda x: (-x[1][1], -x[1][0], x[0])):
+        lines.append("{:<12} {:>8} {:>8}".format(name, cpus, gpus))
+    lines.append("")
+    lines.append("jobs: " + ", ".join("{} {}".format(n, s.lower()) for s, n in totals.state_counts().items()))
+    lines.append("nodes by cpu load:")
+    hist = totals.load_histogram(capacity)
+    for b in range(len(hist)):
+        lines.append("  {:>3}-{:<3}% {:>5}".format(b * 10, (b + 1) * 10, hist[b]))
+    return "\n".join(lines)
+
+
+# Benchmark with a synthetic queue, 4 nodes per job at most. A full load
+# is what a first refresh, a new snapshot or a federation refresh costs:
+# the totals of the whole queue, then every total read. A refresh is what
+# swqueue does between two scheduler queries: the jobs of a diff of churn
+# jobs go through the totals, then every total is read.
+def random_job(rng, users, partitions, node_names):
+    running = rng.random() < 0.6
+    width = rng.randint(1, 4)
+    first = rng.randrange(len(node_names) - width)
+    return {'users': [rng.choice(users)], 'partition': rng.choice(partitions),
+            'state': 'RUNNING' if running else 'PENDING', 'cpus': rng.randint(1, 40),
+            'gpus': rng.choice([0, 0, 1, 2, 4]) * width,
+            'nodes': node_names[first:first+width] if running else []}
+
+def run_benchmark(num_jobs, num_nodes, churn, repeat):
+    node_names = ["n{:05d}".format(i) for i in range(num_nodes)]
+    users = ["user{}".format(i) for i in range(500)]
+    partitions = ["cpu", "gpu", "debug", "long"]
+    rng = random.Random(0)
+    jobid_info = {jobid: random_job(rng, users, partitions, node_names) for jobid in range(num_jobs)}
+    capacity = {n: 160 for n in node_names}
+
+    def read(totals):
+        totals.node_totals()
+        totals.partition_totals()
+        totals.user_totals()
+        totals.state_counts()
+        totals.load_histogram(capacity)
+
+    full = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        totals = from_jobid_info(jobid_info)
+        read(totals)
+        elapsed = time.perf_counter() - start
+        full = elapsed if full == None else min(full, elapsed)
+
+    best = None
+    next_jobid = num_jobs
+    for i in range(repeat):
+        ended = rng.sample(sorted(totals.jobs), churn // 2)
+        changed = rng.sample(sorted(set(totals.jobs) - set(ended)), churn - churn // 2)
+        added = list(range(next_jobid, next_jobid + churn // 2))
+        new_jobs = {jobid: random_job(rng, users, partitions, node_names) for jobid in changed + added}
+        start = time.perf_counter()
+        for jobid in ended:
+            totals.remove_job(jobid)
+        for jobid in changed + added:
+            totals.add_job(jobid, new_jobs[jobid])
+        read(totals)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+        next_jobid += len(added)
+
+    print("{} jobs, {} nodes, {} jobs changed per refresh".format(num_jobs, num_nodes, churn))
+    print("  full load   {:8.1f} ms (best of {})".format(full * 1000, repeat))
+    print("  refresh     {:8.1f} ms (best of {})".format(best * 1000, repeat))
+    return max(full, best)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the swqueue aggregation",
+        usage="python3 swagg.py [-j JOBS] [-n NODES] [-c CHURN] [-r REPEAT]")
+    parser.add_argument("-j", "--jobs", type=int, default=50000)
+    parser.add_argument("-n", "--nodes", type=int, default=1000)
+    parser.add_argument("-c", "--churn", type=int, default=1000)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    best = run_benchmark(args.jobs, args.nodes, args.churn, args.repeat)
+    print("PASS" if best < 0.050 else "SLOW", "(target 50 ms)")
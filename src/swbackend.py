@@ -0,0 +1,190 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swbackend.py
+# version 1.0
+#
+
+import subprocess
+import json
+import time
+
+from swjobs import JobRecord, parse_job_records, parse_gres_idx
+from swhostlist import expand_hostlist
+
+# Backends are the sources swqueue reads the state of the cluster from.
+# Every backend yields JobRecord objects from job_records() so the rest of
+# swqueue does not care where the data came from.
+class Backend:
+    name = ""
+    # cluster of a multi-cluster (-M) setup, None for the local one
+    cluster = None
+
+    def job_records(self):
+        raise NotImplementedError
+
+
+# Runs scontrol directly, one job per line, and parses its stdout while
+# it is being written. --details adds the cpu ids and gpu indices of jobs.
+class ScontrolBackend(Backend):
+    name = "scontrol"
+    command = ['scontrol', 'show', 'job', '--details', '--oneliner']
+
+    def __init__(self, cluster=None):
+        self.cluster = cluster
+
+    def job_records(self):
+        command = cluster_command(self.command, self.cluster)
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+        try:
+            for rec in parse_job_records(proc.stdout):
+                yield rec
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, command)
+
+
+# Reads the structured output of squeue --json (or scontrol show job --json)
+class JsonBackend(Backend):
+    name = "json"
+    command = ['squeue', '--json']
+
+    def __init__(self, cluster=None):
+        self.cluster = cluster
+
+    def job_records(self):
+        command = cluster_command(self.command, self.cluster)
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+        try:
+            data = json.load(proc.stdout)
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, command)
+
+        for job in data.get('jobs', []):
+            yield json_to_record(job)
+
+
+# Replays a saved dump, either scontrol text or squeue --json output,
+# to test and benchmark swqueue without a scheduler
+class FileBackend(Backend):
+    name = "file"
+
+    def __init__(self, path, cluster=None):
+        self.path = path
+        self.cluster = cluster
+
+    def job_records(self):
+        with open(self.path, 'r') as f:
+            first = f.read(1)
+            f.seek(0)
+            if first == '{':
+                for job in json.load(f).get('jobs', []):
+                    yield json_to_record(job)
+            else:
+                for rec in parse_job_records(f):
+                    yield rec
+
+
+# Adds -M CLUSTER to a slurm command, scontrol and squeue both take it
+def cluster_command(command, cluster):
+    if cluster == None:
+        return command
+    return command[:1] + ['-M', cluster] + command[1:]
+
+# Newer Slurm versions wrap numbers as {"set": true, "infinite": false, "number": 5}
+def json_number(value):
+    if type(value) == dict:
+        if value.get('infinite', False):
+            return None
+        if value.get('set', True) == False:
+            return 0
+        return value.get('number', 0)
+    return value
+
+def json_time(value):
+    t = json_number(value)
+    if t == None or t == 0:
+        return "Unknown"
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t))
+
+# time limits are given in minutes, convert them to the scontrol notation
+def json_time_limit(value):
+    minutes = json_number(value)
+    if minutes == None:
+        return "UNLIMITED"
+    days, minutes = divmod(minutes, 24*60)
+    hours, minutes = divmod(minutes, 60)
+    if days > 0:
+        return "{}-{:02d}:{:02d}:00".format(days, hours, minutes)
+    return "{:02d}:{:02d}:00".format(hours, minutes)
+
+def json_to_record(job):
+    rec = JobRecord(int(json_number(job['job_id'])))
+    state = job.get('job_state', 'UNKNOWN')
+    rec.state = state[0] if type(state) == list else state
+    rec.user = job.get('user_name', "")
+    rec.partition = job.get('partition', "")
+    rec.priority = json_number(job.get('priority', 0)) or 0
+    rec.nodelist = job.get('nodes', "")
+    rec.tres = job.get('tres_alloc_str', "")
+    rec.req_tres = job.get('tres_req_str', "")
+    rec.submit_time = json_time(job.get('submit_time', 0))
+    rec.start_time = json_time(job.get('start_time', 0))
+    rec.end_time = json_time(job.get('end_time', 0))
+    rec.time_limit = json_time_limit(job.get('time_limit', 0))
+    # one gres_detail entry per allocated node, e.g. gpu:a100:2(IDX:0-1)
+    gres_detail = job.get('gres_detail', [])
+    if rec.nodelist != "" and len(gres_detail) > 0:
+        for name, gres in zip(expand_hostlist(rec.nodelist), gres_detail):
+            rec.alloc.append([name, "", parse_gres_idx(gres)])
+    return rec.finish()
+
+
+BACKENDS = {
+    ScontrolBackend.name: ScontrolBackend,
+    JsonBackend.name: JsonBackend,
+    FileBackend.name: FileBackend,
+}
+
+# Creates the backend selected on the command line
+def get_backend(name, path=None, cluster=None):
+    if path != None:
+        return FileBackend(path, cluster)
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend {}, choose one of {}".format(name, list(BACKENDS)))
+    if name == FileBackend.name:
+        raise ValueError("The file backend needs a file, use --fixture PATH")
+    return BACKENDS[name](cluster)
@@ -31,12 +31,56 @@
 
 SWS_CONF = {
     "NODE_TYPE_NUM" : 2,
-    "NODE_DEFINE" : [{'node_type': "ppc64le",'tot_cpu':160,'num_skt':2,'cpu_skt':20,'thd_cpu':4,'mem_cpu':1200,'tot_gpu':4,'gpu_type':"v100"}, \
-                     {'node_type': "arm",'tot_cpu':80,'num_skt':1,'cpu_skt':80,'thd_cpu':1,'mem_cpu':4000,'tot_gpu':2,'gpu_type':"a100"}, \
-                     {'node_type': "x86",'tot_cpu':256,'num_skt':8,'cpu_skt':16,'thd_cpu':2,'mem_cpu':3200,'tot_gpu':8,'gpu_type':"a100"}],
+    "NODE_DEFINE" : [{'node_type': "ppc64le",'tot_cpu':160,'num_skt':2,'cpu_skt':20,'thd_cpu':4,'mem_cpu':1200,'tot_gpu':4,'gpu_type':"v100",'gpu_pairs':[[0,1],[2,3]],'gpu_partition':"gpu",'cpu_partition':"cpu"}, \
+                     {'node_type': "arm",'tot_cpu':80,'num_skt':1,'cpu_skt':80,'thd_cpu':1,'mem_cpu':4000,'tot_gpu':2,'gpu_type':"a100",'gpu_pairs':[[0,1]],'gpu_partition':"arm",'cpu_partition':"arm"}, \
+                     {'node_type': "x86",'tot_cpu':256,'num_skt':8,'cpu_skt':16,'thd_cpu':2,'mem_cpu':3200,'tot_gpu':8,'gpu_type':"a100",'gpu_pairs':[],'gpu_partition':"x86",'cpu_partition':"x86"}],
     "NODE_TYPE_DEFAULT" : "x86",
+    "NODE_HOSTLIST" : {"ppc64le": "hal[01-07]"},
+    "TOPOLOGY_CACHE" : "/tmp/.swsuite.{}/topology.json",
+    "TOPOLOGY_CACHE_TTL" : 600,
+    "SNAPSHOT_PATH" : "/dev/shm/swqueue.snapshot",
+    "SNAPSHOT_OWNER" : "root",
+    "SNAPSHOT_INTERVAL" : 30,
+    "SNAPSHOT_MAX_AGE" : 180,
+    "POLL_MIN_INTERVAL" : 5,
+    "POLL_BACKOFF" : 2,
+    "WAIT_MAX_FAILURES" : 5,
+    "RPC_BUDGET_FILE" : "/tmp/.swsuite.{}/rpc",
+    "RPC_BUDGET_PER_MINUTE" : 6,
+    "RPC_BUDGET_BURST" : 3,
+    "CLUSTER_TIMEOUT" : 30,
+    "PROBE_TIMEOUT" : 10,
+    "PROBE_WORKERS" : 32,
+    "SSH_CONTROL_PATH" : "/tmp/.swqueue_ssh.%r@%h:%p",
+    "SSH_CONTROL_PERSIST" : 600,
+    "GPU_IDLE_UTIL" : 5,
+    "GPU_IDLE_SAMPLES" : 3,
+    "USAGE_SAMPLE_INTERVAL" : 10,
+    "EXPORTER_ADDRESS" : "127.0.0.1",
+    "EXPORTER_PORT" : 9742,
+    "EXPORTER_INTERVAL" : 30,
+    "QUEUE_AGE_BUCKETS" : [60, 300, 900, 3600, 4*3600, 24*3600, 3*24*3600, 7*24*3600],
+    "HISTORY_DIR" : "/var/tmp/swqueue_history",
+    "HISTORY_COMPACT_INTERVAL" : 600,
+    "HISTORY_RETENTION_DAYS" : 180,
+    "HAL_CONTAINER_REGISTRY" : "$HAL_CONTAINER_REGISTRY",
+    "CONTAINER_SEARCH_DEPTH_LIMIT" : 3,
+    "ALLOWED_CONTAINER_IMAGE_EXTENSIONS" : [".sif", ".simg"],
+    "CONTAINER_INDEX" : "/tmp/.swsuite.{}/containers.json",
+    "CONTAINER_INDEX_TTL" : 3600,
+    "CONTAINER_STAGE" : False,
+    "CONTAINER_STAGE_DIR" : "/tmp/swsuite_containers.{}",
+    "CONTAINER_STAGE_CAP" : 50*1024**3,
+    "CONTAINER_STAGE_PART_AGE" : 6*3600,
+    "CONTAINER_MPI" : "pmix",
+    "CONTAINER_GPU_BIND" : "closest",
+    "CONTAINER_LAUNCH_MARK" : "#SWLAUNCH",
     "ALLOWED_PARTITIONS" : ["gpux1", "gpux2", "gpux3", "gpux4", "gpux8", "gpux16", "cpux1", "cpux4"],
     "PARTITION_DEFAULT" : "gpux1",
+    "PARTITION_DEFINE" : {"gpux1": {'nodes':1,'gpus':1,'sockets':1}, "gpux2": {'nodes':1,'gpus':2,'sockets':1},
+                          "gpux3": {'nodes':1,'gpus':3,'sockets':2}, "gpux4": {'nodes':1,'gpus':4,'sockets':2},
+                          "gpux8": {'nodes':2,'gpus':4,'sockets':2}, "gpux16": {'nodes':4,'gpus':4,'sockets':2},
+                          "cpux1": {'nodes':1,'gpus':0,'sockets':2}, "cpux4": {'nodes':1,'gpus':0,'sockets':2}},
     "ALLOWED_NODE_TYPE" : ["ppc64le", "arm", "x86"],
     "NODES" : 1,
     "NTASKS_PER_NODE" : 16,
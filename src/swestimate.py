@@ -0,0 +1,348 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swestimate.py
+# version 1.0
+#
+
+import argparse
+import bisect
+import heapq
+import random
+import time
+
+import swconfig as swc
+
+from swtime import format_timestamp
+from swlayout import job_layout
+
+# Start time estimates of pending jobs. Every node gets a profile of its
+# free cpus and gpus over time: what is free now, plus what running jobs
+# give back at start time + time limit. Pending jobs are then placed in
+# priority order (submit time among equals) at the earliest time enough
+# eligible nodes stay free for their whole time limit, and the resources
+# are reserved. A job may start before higher priority jobs as long as it
+# does not delay their reservations, like the conservative backfill of
+# slurm. Time limits are upper bounds, so the estimates are too.
+
+# Free cpus and gpus of one node as a step function of time: from times[i]
+# until times[i+1] (or forever for the last step) cpus[i] and gpus[i] are free
+class NodeProfile:
+    __slots__ = ('times', 'cpus', 'gpus')
+
+    def __init__(self, now, cpus, gpus):
+        self.times = [now]
+        self.cpus = [cpus]
+        self.gpus = [gpus]
+
+    # Index of the step holding t, inserting a breakpoint at t if needed
+    def split(self, t):
+        i = bisect.bisect_right(self.times, t) - 1
+        if self.times[i] == t:
+            return i
+        self.times.insert(i + 1, t)
+        self.cpus.insert(i + 1, self.cpus[i])
+        self.gpus.insert(i + 1, self.gpus[i])
+        return i + 1
+
+    # Adds cpus and gpus (negative to take them) from start until end, end
+    # None meaning forever
+    def add(self, start, end, cpus, gpus):
+        i = self.split(start)
+        j = self.split(end) if end != None else len(self.times)
+        for k in range(i, j):
+            self.cpus[k] += cpus
+            self.gpus[k] += gpus
+
+    # Earliest time >= t from which cpus and gpus stay free for duration
+    # seconds (forever if None), None if that does not happen before limit
+    def earliest(self, t, cpus, gpus, duration, limit=None):
+        i = max(bisect.bisect_right(self.times, t) - 1, 0)
+        start = None
+        n = len(self.times)
+        while i < n:
+            if start == None and limit != None and self.times[i] >= limit:
+                return None
+            if self.cpus[i] >= cpus and self.gpus[i] >= gpus:
+                if start == None:
+                    start = max(self.times[i], t)
+                if duration != None and (i + 1 == n or self.times[i+1] >= start + duration):
+                    return start
+            else:
+                start = None
+            i += 1
+        return start
+
+
+# What a job or a hypothetical request needs: nodes, cpus and gpus per
+# node, seconds, the partition it runs in and the node type (None for any)
+class Request:
+    __slots__ = ('num_nodes', 'cpus', 'gpus', 'duration', 'partition', 'node_type')
+
+    def __init__(self, num_nodes, cpus, gpus, duration, partition="", node_type=None):
+        self.num_nodes = max(num_nodes, 1)
+        self.cpus = cpus
+        self.gpus = gpus
+        self.duration = duration
+        self.partition = partition
+        self.node_type = node_type
+
+    def shape(self):
+        return (self.num_nodes, self.cpus, self.gpus, self.duration, self.partition, self.node_type)
+
+def job_request(job):
+    num_nodes = max(job.get('num_nodes', 1), 1)
+    duration = job['limit_seconds']
+    return Request(num_nodes, job['cpus'], job['gpus'] // num_nodes, duration, job.get('partition', ""))
+
+# The request swrun/swbatch make for one of their partitions on a node
+# type (the default one if None), taken from the same layout table as
+# swtools.Builder
+def partition_request(partition, hours=None, cpu_per_gpu=None, node_type=None):
+    if node_type == None:
+        node_type = swc.SWS_CONF['NODE_TYPE_DEFAULT']
+    if hours == None:
+        hours = swc.SWS_CONF['HOURS_DEFAULT']
+    if cpu_per_gpu == None:
+        cpu_per_gpu = swc.SWS_CONF['CPU_PER_GPU_DEFAULT']
+    if partition not in swc.SWS_CONF['ALLOWED_PARTITIONS']:
+        raise ValueError("Unknown partition {}, use one of {}.".format(partition, ", ".join(swc.SWS_CONF['ALLOWED_PARTITIONS'])))
+    layout = job_layout(node_type, partition, cpu_per_gpu)
+    return Request(layout['nodes'], layout['ntasks-per-node'], layout['gpus'], int(hours * 3600),
+                   layout['partition'], node_type)
+
+# Node types to estimate a partition request on: node_type if given,
+# otherwise the default node type if the cluster has any, otherwise every
+# node type of the cluster
+def request_node_types(node_info, node_type=None):
+    if node_type != None:
+        return [node_type]
+    present = sorted(set(v['node_type'] for v in node_info.values() if v.get('node_type') != None))
+    if len(present) == 0 or swc.SWS_CONF['NODE_TYPE_DEFAULT'] in present:
+        return [swc.SWS_CONF['NODE_TYPE_DEFAULT']]
+    return present
+
+
+class Estimator:
+
+    # node_info and jobid_info as built by swqueue.process_frames
+    def __init__(self, node_info, jobid_info, now):
+        self.now = now
+        self.profiles = {}
+        self.partitions = {}
+        self.node_types = {}
+        # the same shape can never start earlier than the last time it was
+        # placed, reservations only take resources away
+        self.lower_bound = {}
+        self.eligible_nodes = {}
+        self.heaps = {}
+        # bumped at every reservation on the node
+        self.version = {}
+        for name, v in node_info.items():
+            up = 'down' not in v['state'] and 'drain' not in v['state']
+            free_cpus = v['tot_cpu'] - v['cpus'] if up else 0
+            free_gpus = v['tot_gpu'] - v['gpus'] if up else 0
+            self.profiles[name] = NodeProfile(now, free_cpus, free_gpus)
+            self.version[name] = 0
+            self.partitions[name] = set(v.get('partitions', []))
+            self.node_types[name] = v.get('node_type')
+        self.capacity = {name: (v['tot_cpu'], v['tot_gpu']) for name, v in node_info.items()}
+
+        for jobid, job in jobid_info.items():
+            if job['state'] != 'RUNNING':
+                continue
+            start = job['start_epoch']
+            limit = job['limit_seconds']
+            if start == None or limit == None:
+                continue
+            # jobs past their limit are about to be killed
+            end = max(start + limit, now)
+            num_nodes = max(len(job['nodes']), 1)
+            for n in job['nodes']:
+                if n in self.profiles:
+                    self.profiles[n].add(end, None, job['cpus'], job['gpus'] // num_nodes)
+
+    def eligible(self, request):
+        key = (request.partition, request.node_type, request.cpus, request.gpus)
+        if key in self.eligible_nodes:
+            return self.eligible_nodes[key]
+        nodes = []
+        for name, profile in self.profiles.items():
+            parts = self.partitions[name]
+            if len(parts) > 0 and request.partition != "" and request.partition not in parts:
+                continue
+            if request.node_type != None and self.node_types[name] != request.node_type:
+                continue
+            tot_cpu, tot_gpu = self.capacity[name]
+            if tot_cpu >= request.cpus and tot_gpu >= request.gpus:
+                nodes.append(name)
+        self.eligible_nodes[key] = nodes
+        return nodes
+
+    # (start, node, node version) of every eligible node that can ever run
+    # request, as a heap. Entries are refreshed lazily: one whose node got a
+    # reservation since is recomputed from its old start, as reservations
+    # only take resources away.
+    def start_heap(self, request, t):
+        key = request.shape()
+        heap = self.heaps.get(key)
+        if heap == None:
+            heap = []
+            for n in self.eligible(request):
+                s = self.profiles[n].earliest(t, request.cpus, request.gpus, request.duration)
+                if s != None:
+                    heap.append((s, n, self.version[n]))
+            heapq.heapify(heap)
+            self.heaps[key] = heap
+        return heap
+
+    # Takes the earliest entry that is up to date and starts at t or later
+    # off the heap, None if no node can run request any more
+    def pop_fresh(self, heap, request, t):
+        while len(heap) > 0:
+            s, n, v = heapq.heappop(heap)
+            if v == self.version[n] and s >= t:
+                return (s, n, v)
+            s = self.profiles[n].earliest(max(s, t), request.cpus, request.gpus, request.duration)
+            if s != None:
+                heapq.heappush(heap, (s, n, self.version[n]))
+        return None
+
+    # Earliest start of request and the nodes it would run on, (None, [])
+    # if it never fits
+    def earliest(self, request):
+        t = max(self.now, self.lower_bound.get(request.shape(), self.now))
+        heap = self.start_heap(request, t)
+        while True:
+            fresh = []
+            while len(fresh) < request.num_nodes:
+                entry = self.pop_fresh(heap, request, t)
+                if entry == None:
+                    break
+                fresh.append(entry)
+            for entry in fresh:
+                heapq.heappush(heap, entry)
+            if len(fresh) < request.num_nodes:
+                return None, []
+            # the k-th earliest node start, when the nodes that fit earlier
+            # do not fit any more by then try again from there
+            last = fresh[-1][0]
+            if fresh[0][0] == last:
+                return last, [n for s, n, v in fresh]
+            t = last
+
+    def reserve(self, request, start, nodes):
+        end = start + request.duration if request.duration != None else None
+        for n in nodes:
+            self.profiles[n].add(start, end, -request.cpus, -request.gpus)
+            self.version[n] += 1
+        self.lower_bound[request.shape()] = start
+
+    # Expected start of every pending job, {jobid: time or None}
+    def pending(self, jobid_info):
+        order = sorted((jobid for jobid, job in jobid_info.items() if job['state'] == 'PENDING'),
+                       key=lambda j: (-jobid_info[j].get('priority', 0), jobid_info[j]['submit_epoch'] or 0, j))
+        starts = {}
+        for jobid in order:
+            request = job_request(jobid_info[jobid])
+            start, nodes = self.earliest(request)
+            starts[jobid] = start
+            if start != None:
+                self.reserve(request, start, nodes)
+        return starts
+
+
+def format_wait(start, now):
+    if start == None:
+        return "never"
+    seconds = int(start - now)
+    if seconds <= 0:
+        return "now"
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    return "{}-{:02d}:{:02d}".format(days, hours, seconds // 60) if days > 0 else "{:02d}:{:02d}".format(hours, seconds // 60)
+
+def format_start(start):
+    return format_timestamp(start) if start != None else "-"
+
+def format_estimates(jobid_info, starts, now):
+    lines = ["{:>8} {:<10} {:<10} {:>5} {:>5} {:>5} {:>11} {:<20} {:>9}".format(
+        "JOBID", "USER", "PARTITION", "NODES", "CPUS", "GPUS", "LIMIT", "EXPECTED START", "WAIT")]
+    for jobid in sorted(starts, key=lambda j: (starts[j] == None, starts[j] or 0, j)):
+        job = jobid_info[jobid]
+        lines.append("{:>8} {:<10} {:<10} {:>5} {:>5} {:>5} {:>11} {:<20} {:>9}".format(
+            jobid, job['users'][0], job.get('partition', ""), job.get('num_nodes', 1), job['cpus'], job['gpus'],
+            job['time_limit'], format_start(starts[jobid]), format_wait(starts[jobid], now)))
+    return "\n".join(lines)
+
+
+# A synthetic cluster: every node runs 4 one gpu jobs and the pending
+# jobs ask for 1 to 4 nodes
+def synthetic_cluster(num_nodes, num_pending):
+    rng = random.Random(0)
+    now = time.time()
+    node_info = {}
+    jobid_info = {}
+    for i in range(num_nodes):
+        name = "n{:05d}".format(i)
+        node_info[name] = {'cpus':0, 'gpus':0, 'tot_cpu':160, 'tot_gpu':4, 'state':'mixed', 'partitions':['gpu']}
+        for k in range(4):
+            jobid_info[len(jobid_info)] = {'state':'RUNNING', 'cpus':40, 'gpus':1, 'nodes':[name], 'partition':'gpu',
+                                           'start_epoch':int(now) - rng.randrange(86400), 'limit_seconds':86400}
+            node_info[name]['cpus'] += 40
+            node_info[name]['gpus'] += 1
+    for k in range(num_pending):
+        width = rng.choice([1, 1, 1, 1, 2, 4])
+        jobid_info[len(jobid_info)] = {'state':'PENDING', 'cpus':rng.choice([16, 32, 64]), 'gpus':rng.choice([1, 2, 4]) * width,
+                                       'num_nodes':width, 'nodes':[], 'partition':'gpu', 'priority':0,
+                                       'submit_epoch':int(now) - k, 'limit_seconds':rng.choice([1800, 7200, 14400, 86400])}
+    return node_info, jobid_info, now
+
+def run_benchmark(num_nodes, num_pending):
+    node_info, jobid_info, now = synthetic_cluster(num_nodes, num_pending)
+    start = time.perf_counter()
+    starts = Estimator(node_info, jobid_info, now).pending(jobid_info)
+    elapsed = time.perf_counter() - start
+    print("{} pending jobs on {} nodes: {:.1f} ms, {} never start".format(
+        num_pending, num_nodes, elapsed * 1000, len([s for s in starts.values() if s == None])))
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the swqueue start time estimates",
+        usage="python3 swestimate.py [-n NODES] [-p PENDING]")
+    parser.add_argument("-n", "--nodes", type=int, default=200)
+    parser.add_argument("-p", "--pending", type=int, default=5000)
+    args = parser.parse_args()
+
+    elapsed = run_benchmark(args.nodes, args.pending)
+    print("PASS" if elapsed < 1.0 else "SLOW", "(target 1 s)")
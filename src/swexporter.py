@@ -0,0 +1,192 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swexporter.py
+# version 1.0
+#
+
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+
+# Prometheus endpoint of swqueue --serve. A refresher thread loads the
+# cluster state every EXPORTER_INTERVAL seconds (from the collector
+# snapshot when there is one) and renders the metrics once, scrapes are
+# answered from that cached text. However many scrapers there are, the
+# scheduler sees one query per interval at most.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def sample(name, labels, value):
+    if len(labels) == 0:
+        return "{} {}".format(name, value)
+    return "{}{{{}}} {}".format(name, ",".join('{}="{}"'.format(k, escape_label(v)) for k, v in labels), value)
+
+class Metrics:
+
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, help, samples):
+        self.lines.append("# HELP {} {}".format(name, help))
+        self.lines.append("# TYPE {} {}".format(name, kind))
+        for labels, value in samples:
+            self.lines.append(sample(name, labels, value))
+
+    # Cumulative histogram of values, buckets are the upper bounds
+    def histogram(self, name, help, labels, values, buckets):
+        self.lines.append("# HELP {} {}".format(name, help))
+        self.lines.append("# TYPE {} histogram".format(name))
+        for key in sorted(values):
+            counts = [0] * len(buckets)
+            for v in values[key]:
+                for i in range(len(buckets)):
+                    if v <= buckets[i]:
+                        counts[i] += 1
+            for i in range(len(buckets)):
+                self.lines.append(sample(name + "_bucket", [(labels, key), ("le", buckets[i])], counts[i]))
+            self.lines.append(sample(name + "_bucket", [(labels, key), ("le", "+Inf")], len(values[key])))
+            self.lines.append(sample(name + "_sum", [(labels, key)], sum(values[key])))
+            self.lines.append(sample(name + "_count", [(labels, key)], len(values[key])))
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+def render_metrics(node_info, jobid_info, totals, buckets, now):
+    m = Metrics()
+    nodes = sorted(node_info.items())
+    # only labels that do not change while the node exists, a drain or a
+    # reboot must not start new series of the resource gauges
+    node_labels = lambda name, v: [("node", name), ("partition", ",".join(v.get('partitions', [])))]
+    m.family("swqueue_node_state", "gauge", "Always 1, the labels give the node type and current slurm state of the node.",
+             [([("node", k), ("node_type", v['node_type']), ("state", v['state'])], 1) for k, v in nodes])
+    m.family("swqueue_node_cpus_allocated", "gauge", "Cpus allocated to running jobs on the node.",
+             [(node_labels(k, v), v['cpus']) for k, v in nodes])
+    m.family("swqueue_node_cpus_total", "gauge", "Cpus of the node.",
+             [(node_labels(k, v), v['tot_cpu']) for k, v in nodes])
+    m.family("swqueue_node_gpus_allocated", "gauge", "Gpus allocated to running jobs on the node.",
+             [(node_labels(k, v), v['gpus']) for k, v in nodes])
+    m.family("swqueue_node_gpus_total", "gauge", "Gpus of the node.",
+             [(node_labels(k, v), v['tot_gpu']) for k, v in nodes])
+
+    partitions = sorted(totals.partition_totals().items())
+    users = sorted(totals.user_totals().items())
+    m.family("swqueue_partition_cpus_allocated", "gauge", "Cpus allocated to running jobs of the partition.",
+             [([("partition", k)], cpus) for k, (cpus, gpus) in partitions])
+    m.family("swqueue_partition_gpus_allocated", "gauge", "Gpus allocated to running jobs of the partition.",
+             [([("partition", k)], gpus) for k, (cpus, gpus) in partitions])
+    m.family("swqueue_user_cpus_allocated", "gauge", "Cpus allocated to running jobs of the user.",
+             [([("user", k)], cpus) for k, (cpus, gpus) in users])
+    m.family("swqueue_user_gpus_allocated", "gauge", "Gpus allocated to running jobs of the user.",
+             [([("user", k)], gpus) for k, (cpus, gpus) in users])
+
+    jobs = {}
+    ages = {}
+    for job in jobid_info.values():
+        key = (job['state'], job.get('partition', ""))
+        jobs[key] = jobs.get(key, 0) + 1
+        submitted = job['submit_epoch']
+        if job['state'] == 'PENDING' and submitted != None:
+            ages.setdefault(job.get('partition', ""), []).append(max(now - submitted, 0))
+    m.family("swqueue_jobs", "gauge", "Running and pending jobs.",
+             [([("state", s.lower()), ("partition", p)], n) for (s, p), n in sorted(jobs.items())])
+    m.histogram("swqueue_pending_age_seconds", "Time pending jobs have been waiting since submission.",
+                "partition", ages, buckets)
+
+    m.family("swqueue_last_update_timestamp_seconds", "gauge", "When the cluster state was last loaded.",
+             [([], now)])
+    return m.text()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.server.cache.get()
+        if body == None:
+            self.send_error(503, "no cluster state yet")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+# Metrics text shared between the refresher and the request handlers
+class MetricsCache:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.body = None
+
+    def get(self):
+        with self.lock:
+            return self.body
+
+    def set(self, body):
+        with self.lock:
+            self.body = body
+
+# Serves the metrics on address:port. load() returns (node_info, jobid_info,
+# totals), totals being swagg.JobTotals, and is called every interval
+# seconds by a single thread.
+def serve(load, address, port, interval, buckets):
+    cache = MetricsCache()
+
+    def refresh():
+        while True:
+            try:
+                node_info, jobid_info, totals = load()
+                cache.set(render_metrics(node_info, jobid_info, totals, buckets, time.time()).encode())
+            except Exception as e:
+                # keep serving the last state, the next refresh may work
+                print("swqueue --serve: refresh failed: {}".format(e))
+            time.sleep(interval)
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.cache = cache
+    threading.Thread(target=refresh, daemon=True).start()
+    print("Serving metrics on http://{}:{}/metrics".format(address, port))
+    server.serve_forever()
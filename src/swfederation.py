@@ -0,0 +1,199 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swfederation.py
+# version 1.0
+#
+
+import time
+import threading
+from concurrent.futures import Future, wait
+
+from swhostlist import parse_hostlist, compress_hostlist
+from swstore import JobStore
+
+# One view over several clusters (swqueue -M a,b). Every cluster keeps its
+# own state and is loaded in a thread of its own, a refresh waits at most
+# CLUSTER_TIMEOUT seconds for them. A cluster that fails or does not answer
+# in time is shown with its last state and an error, it never holds back the
+# others, and it is not asked again before its pending load has returned.
+# With more than one cluster nodes and jobs are named cluster:name.
+
+# A cluster of the view, state is the swqueue.ClusterState of the cluster
+class Member:
+    __slots__ = ('cluster', 'backend', 'budget', 'state', 'future', 'started', 'error', 'updated', 'nodes', 'jobs', 'loaded_jobs')
+
+    def __init__(self, cluster, backend, budget, state):
+        self.cluster = cluster
+        self.backend = backend
+        self.budget = budget
+        self.state = state
+        self.future = None
+        self.started = None
+        self.error = ""
+        self.updated = None
+        # the tagged nodes and jobs of the last load, and the jobid_info
+        # they were tagged from
+        self.nodes = {}
+        self.jobs = {}
+        self.loaded_jobs = None
+
+    def idle(self):
+        return self.future == None and self.state.node_info != None
+
+
+class Federation:
+
+    # load(member) refreshes member.state and returns (changed, touched)
+    # like swqueue.load_cluster_state
+    def __init__(self, members, load, timeout):
+        self.members = members
+        self.load = load
+        self.timeout = timeout
+        self.prefixed = len(members) > 1
+        self.node_info = {}
+        self.jobid_info = {}
+        self.store = JobStore()
+
+    def key(self, cluster, name):
+        return "{}:{}".format(cluster, name) if self.prefixed == True else name
+
+    # Loads m in a daemon thread, a scheduler that hangs must not keep
+    # swqueue from exiting either
+    def start(self, m):
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self.load(m))
+            except Exception as e:
+                future.set_exception(e)
+
+        m.future = future
+        m.started = time.time()
+        threading.Thread(target=run, daemon=True).start()
+
+    def tag_node(self, m, name):
+        v = m.state.node_info[name]
+        entry = dict(v)
+        entry['cluster'] = m.cluster
+        entry['host'] = name
+        entry['users_jobids'] = [(self.key(m.cluster, jobid), user) for (jobid, user) in v['users_jobids']]
+        return entry
+
+    def tag_job(self, m, jobid):
+        job = dict(m.state.jobid_info[jobid])
+        job['cluster'] = m.cluster
+        job['jobid'] = jobid
+        job['hosts'] = job['nodes']
+        if self.prefixed == True and len(job['nodes']) > 0:
+            job['nodes'] = parse_hostlist(compress_hostlist([self.key(m.cluster, n) for n in job['nodes']]))
+        return job
+
+    # Brings the tagged copies of a cluster that was just loaded, and the
+    # merged view, up to its state: only the jobs of the diff with the
+    # jobid_info tagged last time and the nodes in names (all if None) are
+    # tagged again, and the store is updated with the same diff. Only
+    # called while no load of the cluster is running.
+    def tag(self, m, names):
+        # swqueue imports this module
+        from swqueue import diff_jobs
+
+        if names == None:
+            for key in m.nodes:
+                del self.node_info[key]
+            m.nodes = {self.key(m.cluster, name): self.tag_node(m, name) for name in m.state.node_info}
+            self.node_info.update(m.nodes)
+        else:
+            for name in names:
+                key = self.key(m.cluster, name)
+                m.nodes[key] = self.node_info[key] = self.tag_node(m, name)
+
+        old = m.loaded_jobs if m.loaded_jobs != None else {}
+        diff = diff_jobs(old, m.state.jobid_info)
+        tagged = {'added': [], 'removed': [], 'changed': []}
+        for kind, jobids in diff.items():
+            for jobid in jobids:
+                key = self.key(m.cluster, jobid)
+                tagged[kind].append(key)
+                if kind == 'removed':
+                    del m.jobs[key]
+                    del self.jobid_info[key]
+                else:
+                    m.jobs[key] = self.jobid_info[key] = self.tag_job(m, jobid)
+        self.store.apply(self.jobid_info, tagged)
+        m.loaded_jobs = m.state.jobid_info
+
+    # Starts a load of every cluster that has none running and waits for
+    # them up to timeout seconds. Returns (changed, touched) of the merged
+    # view, touched being the keys of the nodes to redraw or None for all.
+    def refresh(self):
+        for m in self.members:
+            if m.future == None:
+                self.start(m)
+        done, pending = wait([m.future for m in self.members], timeout=self.timeout)
+
+        changed, touched = False, set()
+        for m in self.members:
+            error = m.error
+            if m.future in done:
+                future, m.future = m.future, None
+                try:
+                    loaded, names = future.result()
+                    m.error = ""
+                    m.updated = time.time()
+                except Exception as e:
+                    loaded, names = False, set()
+                    m.error = "{}: {}".format(type(e).__name__, e)
+                if loaded == True:
+                    self.tag(m, names)
+                    changed = True
+                    if names == None or touched == None:
+                        touched = None
+                    else:
+                        touched.update(self.key(m.cluster, n) for n in names)
+            else:
+                m.error = "no answer for {:.0f}s".format(time.time() - m.started)
+            if m.error != error:
+                # the status lines changed
+                changed = True
+
+        return changed, touched
+
+    # One line per cluster that failed or is late
+    def status_lines(self):
+        lines = []
+        for m in self.members:
+            if m.error == "":
+                continue
+            since = time.strftime('%H:%M:%S', time.localtime(m.updated)) if m.updated != None else "never"
+            lines.append("cluster {}: {}, last update {}".format(m.cluster, m.error, since))
+        return lines
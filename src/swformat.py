@@ -0,0 +1,154 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swformat.py
+# version 1.0
+#
+
+import csv
+import json
+
+from swjobs import format_mask
+
+# Machine readable output of swqueue (--format). jobid_info and node_info
+# entries are written as flat records, one per line for jsonl and csv, so
+# a consumer can start on them before the dump is complete. json writes
+# one document per refresh holding the same records in a list.
+
+FORMATS = ['json', 'jsonl', 'csv']
+
+FIELDS = ['type', 'time', 'cluster', 'jobid', 'node', 'state', 'user', 'partition', 'nodes', 'node_type',
+          'cpus', 'tot_cpu', 'gpus', 'tot_gpu', 'cpu_ids', 'gpu_ids', 'jobs',
+          'submit_time', 'start_time', 'time_limit', 'age', 'remaining', 'error']
+
+# records are flushed every FLUSH_RECORDS records and at the end of a refresh
+FLUSH_RECORDS = 256
+
+# age is the time since submission, remaining the walltime left to a
+# running job, both in seconds. Jobs and nodes of a multi-cluster view
+# carry their cluster, their own jobid and node name are written.
+def job_record(jobid, job, now):
+    submitted, started, limit = job['submit_epoch'], job['start_epoch'], job['limit_seconds']
+    remaining = None
+    if job['state'] == 'RUNNING' and started != None and limit != None:
+        remaining = max(started + limit - now, 0)
+    return {'type':'job', 'time':None, 'cluster':job.get('cluster'), 'jobid':job.get('jobid', jobid), 'state':job['state'], 'user':job['users'][0],
+            'partition':job.get('partition', ""), 'nodes':str(job.get('hosts', job['nodes'])), 'cpus':job['cpus'],
+            'gpus':job['gpus'], 'submit_time':job['submit_time'], 'start_time':job['start_time'],
+            'time_limit':job['time_limit'], 'age':now - submitted if submitted != None else None,
+            'remaining':remaining}
+
+def node_record(name, v):
+    return {'type':'node', 'time':None, 'cluster':v.get('cluster'), 'node':v.get('host', name),
+            'node_type':v['node_type'], 'state':v['state'],
+            'cpus':v['cpus'], 'tot_cpu':v['tot_cpu'], 'gpus':v['gpus'], 'tot_gpu':v['tot_gpu'],
+            'cpu_ids':format_mask(v['cpu_mask']), 'gpu_ids':format_mask(v['gpu_mask']),
+            'jobs':" ".join(str(jobid).split(':')[-1] for jobid, user in v['users_jobids'])}
+
+
+class RecordWriter:
+
+    def __init__(self, out, fmt):
+        if fmt not in FORMATS:
+            raise ValueError("Unknown output format {}, use one of {}.".format(fmt, ", ".join(FORMATS)))
+        self.out = out
+        self.fmt = fmt
+        self.csv = csv.DictWriter(out, FIELDS, extrasaction='ignore') if fmt == 'csv' else None
+        self.header = False
+        self.time = None
+        self.count = 0
+        # whether a record was written in the current refresh
+        self.opened = False
+        # jobids written in the current refresh and the jobs of the last one
+        self.streamed = set()
+        self.last_jobs = {}
+
+    # Starts a refresh, nothing is written until the first record
+    def begin(self, now):
+        self.time = int(now)
+        self.opened = False
+        self.streamed = set()
+
+    def write(self, record):
+        record['time'] = self.time
+        if self.fmt == 'csv':
+            if self.header == False:
+                self.csv.writeheader()
+                self.header = True
+            self.csv.writerow(record)
+        elif self.fmt == 'jsonl':
+            self.out.write(json.dumps(record, separators=(',', ':')) + "\n")
+        else:
+            self.out.write(('{{"time":{},"records":[\n'.format(self.time) if self.opened == False else ",\n") +
+                           json.dumps(record, separators=(',', ':')))
+        self.opened = True
+        self.count += 1
+        if self.count % FLUSH_RECORDS == 0:
+            self.out.flush()
+
+    def job(self, jobid, job):
+        self.streamed.add(jobid)
+        self.write(job_record(jobid, job, self.time))
+
+    # A job that left the queue since the last refresh
+    def removed(self, jobid, job):
+        self.write({'type':'job', 'time':None, 'cluster':job.get('cluster'), 'jobid':job.get('jobid', jobid),
+                    'state':'REMOVED'})
+
+    def node(self, name, v):
+        self.write(node_record(name, v))
+
+    # Status of a cluster of a multi-cluster view, error is empty when its
+    # last load worked
+    def cluster(self, name, error):
+        self.write({'type':'cluster', 'time':None, 'cluster':name, 'state':'FAILED' if error != "" else 'UP',
+                    'error':error})
+
+    # Writes the jobs that were not streamed yet and changed since the last
+    # refresh, the jobs that are gone and the nodes in touched (all nodes if
+    # touched is None), then ends the refresh
+    def write_changes(self, node_info, jobid_info, touched):
+        for jobid, job in jobid_info.items():
+            if jobid not in self.streamed and self.last_jobs.get(jobid) != job:
+                self.job(jobid, job)
+        for jobid in self.last_jobs:
+            if jobid not in jobid_info:
+                self.removed(jobid, self.last_jobs[jobid])
+        self.last_jobs = jobid_info
+        for name, v in node_info.items():
+            if touched == None or name in touched:
+                self.node(name, v)
+        self.end()
+
+    def end(self):
+        if self.fmt == 'json' and self.opened == True:
+            self.out.write("\n]}\n")
+        self.out.flush()
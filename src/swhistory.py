@@ -0,0 +1,308 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swhistory.py
+# version 1.0
+#
+
+import struct
+import time
+import os
+
+
+# Utilization history written by the collector (swqueue --collect) and
+# queried with swqueue --history. Every sample holds the cpus and gpus
+# allocated per node, user or partition and the number of seconds it
+# stands for.
+#
+# One append only segment file per day in HISTORY_DIR:
+#   header   magic, format version, flags
+#   'N'      kind, length, name                next name id of the segment
+#   'S'      kind, time, interval, count        followed by count (name id, cpus, gpus)
+#   'T'      same as 'S', the average over the whole day
+# A refresh writes one 'S' record per kind, so a query skips the records
+# of the other kinds without decoding them. Every HISTORY_COMPACT_INTERVAL
+# seconds the samples of today are merged into buckets of that length, and
+# once a day is over its segment gets a 'T' record per kind, so a query
+# spanning whole days reads one record per day. Segments older than
+# HISTORY_RETENTION_DAYS are deleted.
+
+MAGIC = b'SWQH'
+VERSION = 1
+COMPACTED = 1
+HEADER = struct.Struct('<4sHH')
+NAME = struct.Struct('<cBH')
+SAMPLE = struct.Struct('<cBdfH')
+ENTRY = struct.Struct('<Hff')
+
+KINDS = ['node', 'user', 'partition']
+SUFFIX = '.swh'
+
+DAY = 24*3600
+
+def day_of(t):
+    return time.strftime('%Y%m%d', time.localtime(t))
+
+def day_start(day):
+    return time.mktime(time.strptime(day, '%Y%m%d'))
+
+def segment_path(directory, day):
+    return os.path.join(directory, day + SUFFIX)
+
+def segment_days(directory):
+    try:
+        return sorted(f[:-len(SUFFIX)] for f in os.listdir(directory) if f.endswith(SUFFIX))
+    except OSError:
+        return []
+
+# Allocations of one refresh as {(kind, name): (cpus, gpus)}, totals
+# being the swagg.JobTotals of the refresh
+def allocations(node_info, totals):
+    values = {}
+    for name, v in node_info.items():
+        values[('node', name)] = (v['cpus'], v['gpus'])
+    for name, alloc in totals.user_totals().items():
+        values[('user', name)] = alloc
+    for name, alloc in totals.partition_totals().items():
+        values[('partition', name)] = alloc
+    return values
+
+
+class Segment:
+
+    def __init__(self):
+        self.flags = 0
+        self.names = []
+        self.ids = {}
+        # (kind, time, interval, [(name id, cpus, gpus)])
+        self.totals = []
+        self.samples = []
+
+# Reads a segment. Only the records of kind (all kinds if None) from since
+# to until are decoded, with totals_only the 'S' records are skipped.
+def read_segment(path, kind=None, since=None, until=None, totals_only=False):
+    seg = Segment()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return seg
+    if len(data) < HEADER.size:
+        return seg
+    magic, version, seg.flags = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        return seg
+
+    k = KINDS.index(kind) if kind != None else None
+    off = HEADER.size
+    while off < len(data):
+        rtype = data[off:off+1]
+        if rtype == b'N':
+            if off + NAME.size > len(data):
+                break
+            t, nk, length = NAME.unpack_from(data, off)
+            off += NAME.size
+            name = data[off:off+length].decode()
+            off += length
+            seg.ids[(KINDS[nk], name)] = len(seg.names)
+            seg.names.append((KINDS[nk], name))
+        elif rtype == b'S' or rtype == b'T':
+            if off + SAMPLE.size > len(data):
+                break
+            t, sk, when, interval, count = SAMPLE.unpack_from(data, off)
+            off += SAMPLE.size
+            end = off + count * ENTRY.size
+            if end > len(data):
+                # a sample cut short by a crash, the rest of the file is lost
+                break
+            wanted = (k == None or sk == k) and (rtype == b'T' or totals_only == False and
+                     (since == None or when >= since) and (until == None or when <= until))
+            if wanted:
+                sample = (KINDS[sk], when, interval, list(ENTRY.iter_unpack(data[off:end])))
+                (seg.totals if rtype == b'T' else seg.samples).append(sample)
+            off = end
+        else:
+            break
+    return seg
+
+def encode_samples(rtype, seg, when, interval, values):
+    buf = []
+    entries = {}
+    for key, (cpus, gpus) in values.items():
+        if key not in seg.ids:
+            name = key[1].encode()
+            buf.append(NAME.pack(b'N', KINDS.index(key[0]), len(name)) + name)
+            seg.ids[key] = len(seg.names)
+            seg.names.append(key)
+        entries.setdefault(key[0], []).append(ENTRY.pack(seg.ids[key], cpus, gpus))
+    for kind, packed in entries.items():
+        buf.append(SAMPLE.pack(rtype, KINDS.index(kind), when, interval, len(packed)))
+        buf.extend(packed)
+    return b"".join(buf)
+
+# Merges the samples of a segment whose bucket of bucket seconds ended
+# before now. With final all samples are merged and 'T' records added.
+def compact_segment(path, bucket, now, final):
+    seg = read_segment(path)
+    if seg.flags & COMPACTED:
+        return
+    # (bucket start, kind) -> [seconds, {key: [cpu seconds, gpu seconds]}]
+    buckets = {}
+    totals = {}
+    raw = []
+    for kind, when, interval, entries in seg.samples:
+        start = int(when // bucket) * bucket
+        if final == False and start + bucket > now:
+            raw.append((kind, when, interval, entries))
+            continue
+        targets = [buckets.setdefault((start, kind), [0, {}])]
+        if final == True:
+            targets.append(totals.setdefault((0, kind), [0, {}]))
+        for b in targets:
+            b[0] += interval
+            for i, cpus, gpus in entries:
+                s = b[1].setdefault(seg.names[i], [0, 0])
+                s[0] += cpus * interval
+                s[1] += gpus * interval
+
+    average = lambda sums, seconds: {k: (v[0] / max(seconds, 1), v[1] / max(seconds, 1)) for k, v in sums.items()}
+    out = Segment()
+    buf = [HEADER.pack(MAGIC, VERSION, COMPACTED if final == True else 0)]
+    first = min([when for kind, when, interval, entries in seg.samples] + [now])
+    for (start, kind), (seconds, sums) in sorted(totals.items()):
+        buf.append(encode_samples(b'T', out, first, seconds, average(sums, seconds)))
+    for (start, kind), (seconds, sums) in sorted(buckets.items()):
+        buf.append(encode_samples(b'S', out, start, seconds, average(sums, seconds)))
+    for kind, when, interval, entries in raw:
+        buf.append(encode_samples(b'S', out, when, interval, {seg.names[i]: (c, g) for i, c, g in entries}))
+
+    tmp = "{}.{}".format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(b"".join(buf))
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+# Appending side, used by the collector
+class HistoryWriter:
+
+    def __init__(self, directory, interval, bucket, retention_days):
+        self.directory = directory
+        self.interval = interval
+        self.bucket = bucket
+        self.retention_days = retention_days
+        self.day = None
+        self.segment = None
+        self.last_time = None
+        self.last_compaction = time.time()
+        os.makedirs(directory, mode=0o755, exist_ok=True)
+
+    def open_day(self, day):
+        path = segment_path(self.directory, day)
+        self.segment = read_segment(path)
+        if os.path.exists(path) == False or os.path.getsize(path) < HEADER.size:
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0))
+        elif self.segment.flags & COMPACTED:
+            # the clock went back to a finished day, its buckets are merged
+            # again with the new samples at the next compaction
+            with open(path, 'r+b') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0))
+            self.segment.flags = 0
+        self.day = day
+        self.maintain()
+
+    # Finishes the segments of past days and drops expired ones
+    def maintain(self):
+        oldest = day_of(time.time() - self.retention_days * DAY)
+        for day in segment_days(self.directory):
+            path = segment_path(self.directory, day)
+            if day < oldest:
+                os.remove(path)
+            elif day < self.day:
+                compact_segment(path, self.bucket, time.time(), True)
+
+    def append(self, now, node_info, totals):
+        day = day_of(now)
+        if day != self.day:
+            self.open_day(day)
+        # a gap, e.g. while the collector was down, is not counted as usage
+        interval = self.interval if self.last_time == None else min(now - self.last_time, 2 * self.interval)
+        self.last_time = now
+        path = segment_path(self.directory, day)
+        buf = encode_samples(b'S', self.segment, now, interval, allocations(node_info, totals))
+        with open(path, 'ab') as f:
+            f.write(buf)
+
+        if now - self.last_compaction >= self.bucket:
+            compact_segment(path, self.bucket, now, False)
+            # name ids change with the rewrite
+            self.segment = read_segment(path)
+            self.last_compaction = now
+
+
+# Usage per name of a kind from since to until: {name: [cpu seconds, gpu
+# seconds]} and the number of seconds covered
+def query(directory, kind, since, until=None):
+    if until == None:
+        until = time.time()
+    usage = {}
+    covered = 0
+    first, last = day_of(since), day_of(until)
+    for day in segment_days(directory):
+        if day < first or day > last:
+            continue
+        path = segment_path(directory, day)
+        whole = day_start(day) >= since and day_start(day) + DAY <= until
+        seg = read_segment(path, kind, since, until, totals_only=whole)
+        samples = seg.totals if whole and len(seg.totals) > 0 else seg.samples
+        if whole and len(seg.totals) == 0:
+            # a past day the collector has not finished yet
+            samples = read_segment(path, kind, since, until).samples
+        for k, when, interval, entries in samples:
+            covered += interval
+            for i, cpus, gpus in entries:
+                name = seg.names[i][1]
+                u = usage.get(name)
+                if u == None:
+                    u = usage[name] = [0.0, 0.0]
+                u[0] += cpus * interval
+                u[1] += gpus * interval
+    return usage, covered
+
+def format_history(usage, covered, kind, since):
+    lines = ["Usage by {} since {} ({:.1f} hours recorded)".format(
+        kind, time.strftime('%Y-%m-%d %H:%M', time.localtime(since)), covered / 3600.0)]
+    lines.append("{:<16} {:>12} {:>12} {:>10} {:>10}".format(kind.upper(), "CPU-HOURS", "GPU-HOURS", "AVG CPUS", "AVG GPUS"))
+    for name, (cpu_s, gpu_s) in sorted(usage.items(), key=lambda x: (-x[1][1], -x[1][0], x[0])):
+        lines.append("{:<16} {:>12.1f} {:>12.1f} {:>10.1f} {:>10.2f}".format(
+            name, cpu_s / 3600.0, gpu_s / 3600.0, cpu_s / max(covered, 1), gpu_s / max(covered, 1)))
+    return "\n".join(lines)
@@ -0,0 +1,275 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swhostlist.py
+# version 1.0
+#
+
+import re
+import itertools
+from functools import lru_cache
+
+# Slurm hostlist expressions, e.g.
+#   hal[01-07]                    -> hal01 ... hal07
+#   hal[01-03,05],arm[1-2]-ib     -> hal01 hal02 hal03 hal05 arm1-ib arm2-ib
+#   rack[1-2]n[01-04]             -> rack1n01 ... rack2n04
+#   gpu[a[1-2],b3]                -> gpua1 gpua2 gpub3
+# A HostList keeps the ranges and not the names, so checking membership or
+# counting the nodes of a 1000 node job allocates nothing. Names are only
+# created when the HostList is iterated.
+
+# One term of a hostlist: literal text parts and bracket ranges in order.
+# Each bracket is a tuple of (lo, hi, width) ranges, width is the zero
+# padding of the numbers.
+class HostPattern:
+    __slots__ = ('parts', 'brackets', 'regex')
+
+    def __init__(self, parts, brackets):
+        self.parts = parts
+        self.brackets = brackets
+        self.regex = re.compile("(\\d+)".join(re.escape(p) for p in parts) + "$")
+
+    def __len__(self):
+        total = 1
+        for bracket in self.brackets:
+            total *= sum(hi - lo + 1 for lo, hi, width in bracket)
+        return total
+
+    def __iter__(self):
+        numbers = [bracket_numbers(bracket) for bracket in self.brackets]
+        for combo in itertools.product(*numbers):
+            name = self.parts[0]
+            for i in range(len(combo)):
+                name += combo[i] + self.parts[i+1]
+            yield name
+
+    def __contains__(self, name):
+        m = self.regex.match(name)
+        if m == None:
+            return False
+        for digits, bracket in zip(m.groups(), self.brackets):
+            if not in_bracket(digits, bracket):
+                return False
+        return True
+
+    def __str__(self):
+        st = self.parts[0]
+        for i in range(len(self.brackets)):
+            st += "[{}]{}".format(format_bracket(self.brackets[i]), self.parts[i+1])
+        return st
+
+
+def bracket_numbers(bracket):
+    for lo, hi, width in bracket:
+        for n in range(lo, hi+1):
+            yield str(n).zfill(width)
+
+def in_bracket(digits, bracket):
+    n = int(digits)
+    for lo, hi, width in bracket:
+        if lo <= n <= hi and len(digits) == max(width, len(str(n))):
+            return True
+    return False
+
+def format_range(lo, hi, width):
+    if lo == hi:
+        return str(lo).zfill(width)
+    return "{}-{}".format(str(lo).zfill(width), str(hi).zfill(width))
+
+def format_bracket(bracket):
+    return ",".join(format_range(lo, hi, width) for lo, hi, width in bracket)
+
+
+# A parsed hostlist expression
+class HostList:
+    __slots__ = ('patterns',)
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+
+    def __len__(self):
+        return sum(len(p) for p in self.patterns)
+
+    def __iter__(self):
+        for p in self.patterns:
+            for name in p:
+                yield name
+
+    def __contains__(self, name):
+        for p in self.patterns:
+            if name in p:
+                return True
+        return False
+
+    def __bool__(self):
+        return len(self.patterns) > 0
+
+    def __eq__(self, other):
+        return isinstance(other, HostList) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __str__(self):
+        return ",".join(str(p) for p in self.patterns)
+
+    def __repr__(self):
+        return "HostList('{}')".format(self)
+
+
+# Splits on the commas that are not inside brackets
+def split_terms(expr):
+    terms = []
+    depth = 0
+    start = 0
+    for i in range(len(expr)):
+        ch = expr[i]
+        if ch == '[':
+            depth += 1
+        elif ch == ']':
+            depth -= 1
+            if depth < 0:
+                raise ValueError("Unbalanced ']' in hostlist {}".format(expr))
+        elif ch == ',' and depth == 0:
+            terms.append(expr[start:i])
+            start = i+1
+    if depth != 0:
+        raise ValueError("Unbalanced '[' in hostlist {}".format(expr))
+    terms.append(expr[start:])
+    return [t for t in terms if t != ""]
+
+def parse_bracket(text, expr):
+    bracket = []
+    for item in text.split(','):
+        lo, sep, hi = item.partition('-')
+        if not lo.isdigit() or (sep != "" and not hi.isdigit()):
+            raise ValueError("Invalid range [{}] in hostlist {}".format(text, expr))
+        if sep == "":
+            hi = lo
+        if int(hi) < int(lo):
+            raise ValueError("Invalid range [{}] in hostlist {}".format(text, expr))
+        bracket.append((int(lo), int(hi), len(lo)))
+    return tuple(bracket)
+
+NUMERIC_BRACKET = set("0123456789,-")
+
+# Nested brackets such as gpu[a[1-2],b3]-ib hold a hostlist instead of
+# numbers, they are distributed into flat terms: gpua[1-2]-ib, gpub3-ib
+def flatten_term(term):
+    depth = 0
+    start = 0
+    for i in range(len(term)):
+        ch = term[i]
+        if ch == '[':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == ']':
+            depth -= 1
+            inner = term[start+1:i]
+            if depth == 0 and not set(inner) <= NUMERIC_BRACKET:
+                flat = []
+                for item in split_terms(inner):
+                    flat.extend(flatten_term(term[:start] + item + term[i+1:]))
+                return flat
+    return [term]
+
+def parse_term(term, expr):
+    parts = []
+    brackets = []
+    text = ""
+    i = 0
+    while i < len(term):
+        ch = term[i]
+        if ch == '[':
+            end = term.index(']', i)
+            parts.append(text)
+            brackets.append(parse_bracket(term[i+1:end], expr))
+            text = ""
+            i = end + 1
+        else:
+            text += ch
+            i += 1
+    parts.append(text)
+    return HostPattern(parts, brackets)
+
+# Parsed expressions are cached, the same nodelists show up in every refresh
+@lru_cache(maxsize=4096)
+def parse_hostlist(expr):
+    expr = expr.strip()
+    if expr in ("", "(null)", "None"):
+        return HostList(())
+    patterns = []
+    for term in split_terms(expr):
+        for flat in flatten_term(term):
+            patterns.append(parse_term(flat, expr))
+    return HostList(tuple(patterns))
+
+# Lazily yields the node names of an expression
+def expand_hostlist(expr):
+    return iter(parse_hostlist(expr))
+
+
+HOST_NUMBER = re.compile("^(.*?)(\\d+)(\\D*)$")
+
+# Compresses node names into a hostlist expression, names sharing the same
+# prefix and suffix are folded into one bracket
+def compress_hostlist(names):
+    groups = {}
+    order = []
+    for name in names:
+        m = HOST_NUMBER.match(name)
+        key = (name, None) if m == None else (m.group(1), m.group(3))
+        if key not in groups:
+            groups[key] = set()
+            order.append(key)
+        if m != None:
+            groups[key].add((int(m.group(2)), m.group(2)))
+
+    terms = []
+    for key in order:
+        prefix, suffix = key
+        if suffix == None:
+            terms.append(prefix)
+            continue
+        ranges = []
+        for n, digits in sorted(groups[key]):
+            if len(ranges) > 0:
+                lo, hi, width = ranges[-1]
+                if n == hi + 1 and str(n).zfill(width) == digits:
+                    ranges[-1] = (lo, n, width)
+                    continue
+            ranges.append((n, n, len(digits)))
+        if len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+            terms.append(prefix + format_range(*ranges[0]) + suffix)
+        else:
+            terms.append("{}[{}]{}".format(prefix, format_bracket(ranges), suffix))
+    return ",".join(terms)
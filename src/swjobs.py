@@ -0,0 +1,269 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swjobs.py
+# version 1.0
+#
+
+import re
+
+from swhostlist import parse_hostlist
+
+# One job as reported by scontrol, reduced to the fields swqueue uses.
+# cpus, gpus and num_nodes come from the TRES string, the times are kept
+# as the raw strings printed by scontrol. alloc holds the exact placement
+# printed by scontrol show job -d, one [nodes, cpu ids, gpu indices] entry
+# per Nodes= line, e.g. ["hal[02-03]", "0-159", "0-3"].
+class JobRecord:
+    __slots__ = ('jobid', 'user', 'state', 'partition', 'nodelist',
+                 'cpus', 'gpus', 'num_nodes', 'priority',
+                 'submit_time', 'start_time', 'end_time', 'time_limit',
+                 'tres', 'req_tres', 'alloc')
+
+    def __init__(self, jobid):
+        self.jobid = jobid
+        self.user = ""
+        self.state = "UNKNOWN"
+        self.partition = ""
+        self.nodelist = ""
+        self.cpus = 0
+        self.gpus = 0
+        self.num_nodes = 1
+        self.priority = 0
+        self.submit_time = 0
+        self.start_time = 0
+        self.end_time = 0
+        self.time_limit = 0
+        self.tres = ""
+        self.req_tres = ""
+        self.alloc = []
+
+    # Called once all the lines of the job have been seen
+    def finish(self):
+        tres = self.tres if self.tres not in ("", "(null)") else self.req_tres
+        if tres not in ("", "(null)"):
+            self.cpus, self.gpus, self.num_nodes = parse_tres(tres)
+        if self.nodelist == "(null)":
+            self.nodelist = ""
+        return self
+
+    def __repr__(self):
+        return "JobRecord(jobid={}, user={}, state={}, nodelist={}, cpus={}, gpus={})".format(
+            self.jobid, self.user, self.state, self.nodelist, self.cpus, self.gpus)
+
+
+# Takes a TRES value such as cpu=16,mem=19200M,node=1,billing=16,gres/gpu=1
+# and returns total cpus, gpus and nodes
+def parse_tres(tres):
+    cpus = 1
+    gpus = 0
+    nodes = 1
+    for item in tres.split(','):
+        name, sep, count = item.partition('=')
+        if name == 'cpu':
+            cpus = int(count)
+        elif name == 'gres/gpu':
+            gpus = int(count)
+        elif name == 'node':
+            nodes = int(count)
+    return cpus, gpus, max(nodes, 1)
+
+
+GPU_IDX = re.compile("gpu[^,(]*\\(IDX:([^)]*)\\)")
+
+# Takes the GRES of a Nodes= line such as gpu:v100:2(IDX:0,2) and returns
+# the gpu indices, here 0,2
+def parse_gres_idx(gres):
+    m = GPU_IDX.search(gres)
+    if m == None or m.group(1) == "N/A":
+        return ""
+    return m.group(1)
+
+# Bitmap of an index list such as 0-3,8-11
+def index_mask(indices):
+    mask = 0
+    for item in indices.split(','):
+        lo, sep, hi = item.partition('-')
+        if not lo.isdigit():
+            continue
+        lo = int(lo)
+        hi = int(hi) if sep != "" else lo
+        mask |= ((1 << (hi - lo + 1)) - 1) << lo
+    return mask
+
+# Takes the alloc entries of a job and returns {node: (cpu mask, gpu mask)}
+def alloc_masks(alloc):
+    masks = {}
+    for nodes, cpu_ids, gpu_idx in alloc:
+        cpu_mask = index_mask(cpu_ids)
+        gpu_mask = index_mask(gpu_idx)
+        for n in parse_hostlist(nodes):
+            masks[n] = (cpu_mask, gpu_mask)
+    return masks
+
+# Index list of a bitmap, the reverse of index_mask
+def format_mask(mask):
+    ranges = []
+    i = 0
+    while mask >> i:
+        if (mask >> i) & 1:
+            lo = i
+            while (mask >> (i+1)) & 1:
+                i += 1
+            ranges.append(str(lo) if lo == i else "{}-{}".format(lo, i))
+        i += 1
+    return ",".join(ranges)
+
+
+def set_user(record, value):
+    record.user = value.split('(')[0]
+
+def set_state(record, value):
+    record.state = value
+
+def set_priority(record, value):
+    try:
+        record.priority = int(value)
+    except ValueError:
+        record.priority = 0
+
+def set_partition(record, value):
+    record.partition = value
+
+def set_nodelist(record, value):
+    record.nodelist = value
+
+# TRES comes before the Nodes= lines, anything taken for a placement
+# earlier was not one
+def set_tres(record, value):
+    record.tres = value
+    record.alloc = []
+
+def set_req_tres(record, value):
+    record.req_tres = value
+
+def set_submit_time(record, value):
+    record.submit_time = value
+
+def set_start_time(record, value):
+    record.start_time = value
+
+def set_end_time(record, value):
+    record.end_time = value
+
+def set_time_limit(record, value):
+    record.time_limit = value
+
+# The Nodes=, CPU_IDs= and GRES= keys of scontrol show job -d describe the
+# placement on a group of nodes, each Nodes= starts a new group
+def set_alloc_nodes(record, value):
+    record.alloc.append([value, "", ""])
+
+def set_alloc_cpu_ids(record, value):
+    if len(record.alloc) > 0:
+        record.alloc[-1][1] = value
+
+def set_alloc_gres(record, value):
+    if len(record.alloc) > 0:
+        record.alloc[-1][2] = parse_gres_idx(value)
+
+# scontrol key -> setter, every other key is skipped without being stored
+FIELD_SETTERS = {
+    'UserId': set_user,
+    'JobState': set_state,
+    'Partition': set_partition,
+    'Priority': set_priority,
+    'NodeList': set_nodelist,
+    'TRES': set_tres,
+    'AllocTRES': set_tres,
+    'ReqTRES': set_req_tres,
+    'SubmitTime': set_submit_time,
+    'StartTime': set_start_time,
+    'EndTime': set_end_time,
+    'TimeLimit': set_time_limit,
+    'Nodes': set_alloc_nodes,
+    'CPU_IDs': set_alloc_cpu_ids,
+    'GRES': set_alloc_gres,
+    'GRES_IDX': set_alloc_gres,
+}
+
+
+# Keys whose values are free text the job owner chose. JobName is always
+# followed by UserId in slurm's fixed field order, the other ones only come
+# after every field swqueue reads.
+FREE_TEXT = ('Command', 'WorkDir', 'Comment', 'AdminComment', 'SystemComment', 'StdErr', 'StdIn', 'StdOut')
+
+# Reads the output of scontrol show job line by line and yields a JobRecord
+# every time a job is complete. Only the job being read is held in memory.
+# Works for both the multi line and the --oneliner layouts, tokens without
+# a key (e.g. line numbers or the tail of a value with spaces) are ignored.
+# A job only starts at a JobId= opening a line, and free text values are
+# skipped: the tokens of JobName up to UserId, everything from the first
+# other free text key to the next job. A name or a comment can therefore
+# not add jobs or fields of its own.
+def parse_job_records(lines):
+    record = None
+    skip = None
+    for line in lines:
+        tokens = line.split()
+        if len(tokens) == 0:
+            continue
+        if line[0] not in " \t" and tokens[0].startswith('JobId='):
+            if record is not None:
+                yield record.finish()
+            try:
+                record = JobRecord(int(tokens[0][len('JobId='):]))
+            except ValueError:
+                record = None
+            skip = None
+            tokens = tokens[1:]
+        if record is None or skip == 'rest':
+            continue
+        for token in tokens:
+            key, sep, value = token.partition('=')
+            if skip == 'name':
+                if key != 'UserId' or sep == "":
+                    continue
+                skip = None
+            if sep == "":
+                continue
+            if key == 'JobName':
+                skip = 'name'
+            elif key in FREE_TEXT:
+                skip = 'rest'
+                break
+            else:
+                setter = FIELD_SETTERS.get(key)
+                if setter is not None:
+                    setter(record, value)
+
+    if record is not None:
+        yield record.finish()
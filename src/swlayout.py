@@ -0,0 +1,90 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swlayout.py
+# version 1.0
+#
+
+import math
+
+import swconfig as swc
+
+# Resource layouts of swrun/swbatch requests. NODE_DEFINE (node types) and
+# PARTITION_DEFINE (nodes, gpus per node and sockets of every partition)
+# are compiled once, at import, into a table keyed by (node_type,
+# partition, cpu_per_gpu) holding everything Builder writes into the srun
+# or sbatch request. A new node type or partition is a config entry.
+
+# The layout of a partition on one node type
+def build_layout(nd, shape, cpu_per_gpu, conf):
+    gpus = shape['gpus']
+    sockets = shape['sockets']
+    threads = conf['THREADS_PER_CORE']
+    if gpus > 0:
+        cores = math.ceil(cpu_per_gpu / threads * gpus / sockets)
+        ntasks = cores * sockets * threads
+    else:
+        # cpu jobs run a single task
+        cores = 1
+        ntasks = 1
+    return {'partition': nd['gpu_partition'] if gpus > 0 else nd['cpu_partition'],
+            'nodes': shape['nodes'],
+            'gpus': gpus,
+            'ntasks-per-node': ntasks,
+            'sockets-per-node': sockets,
+            'cores-per-socket': cores,
+            'mem-per-cpu': nd['mem_cpu'],
+            'gres': "gpu:{}:{}".format(nd['gpu_type'], conf['GPUS'] * gpus)}
+
+def compile_layouts(conf):
+    table = {}
+    for nd in conf['NODE_DEFINE']:
+        for partition, shape in conf['PARTITION_DEFINE'].items():
+            for cpg in range(conf['CPU_PER_GPU_LL'], conf['CPU_PER_GPU_UL'] + 1):
+                table[(nd['node_type'], partition, cpg)] = build_layout(nd, shape, cpg, conf)
+    return table
+
+NODE_TYPES = {nd['node_type']: nd for nd in swc.SWS_CONF['NODE_DEFINE']}
+LAYOUTS = compile_layouts(swc.SWS_CONF)
+
+# Returns the layout of a request, a dictionary hit for every cpu_per_gpu
+# within the limits. The layout is shared, copy it before changing it.
+def job_layout(node_type, partition, cpu_per_gpu):
+    layout = LAYOUTS.get((node_type, partition, cpu_per_gpu))
+    if layout != None:
+        return layout
+    if node_type not in NODE_TYPES:
+        raise ValueError("Unknown node type {}, use one of {}.".format(node_type, ", ".join(NODE_TYPES)))
+    if partition not in swc.SWS_CONF['PARTITION_DEFINE']:
+        raise ValueError("Unknown partition {}, use one of {}.".format(partition, ", ".join(swc.SWS_CONF['PARTITION_DEFINE'])))
+    layout = LAYOUTS[(node_type, partition, cpu_per_gpu)] = build_layout(
+        NODE_TYPES[node_type], swc.SWS_CONF['PARTITION_DEFINE'][partition], cpu_per_gpu, swc.SWS_CONF)
+    return layout
@@ -0,0 +1,117 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swpoll.py
+# version 1.0
+#
+
+import fcntl
+import time
+import os
+
+from swprivate import open_private
+
+# Refresh interval of swqueue -m. It drops to min_interval as soon as
+# something changed and grows by factor after every refresh that found
+# nothing new, up to max_interval.
+class AdaptivePoller:
+
+    def __init__(self, min_interval, max_interval, factor):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.factor = factor
+        self.interval = min_interval
+
+    def next_interval(self, changed):
+        if changed == True:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.factor, self.max_interval)
+        return self.interval
+
+
+# Token bucket limiting the scheduler queries of one user, shared by all
+# of the user's swqueue processes through a small locked file in the
+# private directory of the user (see swprivate). Faster refreshes never
+# turn into more load on slurmctld than the budget allows. If the file
+# cannot be used the bucket is kept in the process instead.
+class RpcBudget:
+
+    def __init__(self, path, per_minute, burst):
+        self.path = path
+        self.rate = per_minute / 60.0
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.last = time.time()
+
+    # Takes one token out of a bucket holding tokens at time last, returns
+    # (tokens left, seconds to wait)
+    def take(self, tokens, last, now):
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0
+        return tokens, (1 - tokens) / self.rate
+
+    # Takes one token. Returns 0 if the query may go ahead, otherwise the
+    # number of seconds to wait before asking again.
+    def acquire(self):
+        try:
+            fd = open_private(self.path, os.O_RDWR | os.O_CREAT)
+        except OSError:
+            now = time.time()
+            self.tokens, wait = self.take(self.tokens, self.last, now)
+            self.last = now
+            return wait
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            tokens, last = self.burst, now
+            data = os.read(fd, 64).decode().split()
+            if len(data) == 2:
+                try:
+                    tokens, last = float(data[0]), float(data[1])
+                except ValueError:
+                    pass
+            tokens, wait = self.take(tokens, last, now)
+
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, "{} {}".format(tokens, now).encode())
+        finally:
+            os.close(fd)
+        return wait
+
+    # Blocks until a token is available
+    def wait(self):
+        delay = self.acquire()
+        while delay > 0:
+            time.sleep(delay)
+            delay = self.acquire()
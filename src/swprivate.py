@@ -0,0 +1,81 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swprivate.py
+# version 1.0
+#
+
+import os
+import stat
+
+# Per-user state files (caches, indexes, rate limit buckets) kept under
+# /tmp. Each lives in a directory of its own user, created 0700 and checked
+# before anything in it is trusted; files are opened without following
+# symlinks and only used when the calling uid owns them, and are replaced
+# through a temporary file nobody else can have planted.
+
+# Creates directory 0700 if needed and raises OSError unless it is a real
+# directory of this user that nobody else can write to
+def private_dir(directory):
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(directory)
+    if stat.S_ISDIR(st.st_mode) == False or st.st_uid != os.getuid() or st.st_mode & 0o077 != 0:
+        raise OSError("{} is not a private directory of uid {}".format(directory, os.getuid()))
+    return directory
+
+# Opens path in its private directory and returns the file descriptor,
+# raises OSError if the file is not a regular file of this user closed to
+# everyone else
+def open_private(path, flags=os.O_RDONLY, mode=0o600):
+    private_dir(os.path.dirname(path))
+    fd = os.open(path, flags | os.O_NOFOLLOW, mode)
+    try:
+        st = os.fstat(fd)
+        if stat.S_ISREG(st.st_mode) == False or st.st_uid != os.getuid() or st.st_mode & 0o077 != 0:
+            raise OSError("{} is not a private file of uid {}".format(path, os.getuid()))
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+# Replaces path with text, raises OSError
+def write_private(path, text):
+    private_dir(os.path.dirname(path))
+    tmp = "{}.{}".format(path, os.getpid())
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
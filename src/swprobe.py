@@ -0,0 +1,135 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swprobe.py
+# version 1.0
+#
+
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import swconfig as swc
+
+# Runs nvidia-smi on compute nodes over ssh. All nodes are probed at the
+# same time, each with its own timeout, so one hung node only costs its own
+# timeout. ssh multiplexes on a ControlMaster connection which persists for
+# SSH_CONTROL_PERSIST seconds, later probes (e.g. the next swqueue -m
+# refresh) skip the ssh handshake.
+
+NVIDIA_SMI_QUERY = ['nvidia-smi', '--query-gpu=index,name,utilization.gpu,memory.used,memory.total',
+                    '--format=csv,noheader,nounits']
+# gpu and cpu usage in one round trip
+USAGE_QUERY = NVIDIA_SMI_QUERY + [';', 'echo', 'LOADAVG', ';', 'cat', '/proc/loadavg']
+
+class GpuSample:
+    __slots__ = ('index', 'name', 'util', 'mem_used', 'mem_total')
+
+    def __init__(self, index, name, util, mem_used, mem_total):
+        self.index = index
+        self.name = name
+        self.util = util
+        self.mem_used = mem_used
+        self.mem_total = mem_total
+
+    def __repr__(self):
+        return "GPU{} {} util {}% mem {}/{} MiB".format(self.index, self.name, self.util, self.mem_used, self.mem_total)
+
+# Result of probing one node, error is empty when the probe worked
+class NodeProbe:
+    __slots__ = ('node', 'gpus', 'load', 'error')
+
+    def __init__(self, node, gpus=None, load=None, error=""):
+        self.node = node
+        self.gpus = gpus if gpus != None else []
+        # 1 minute load average, only sampled by probe_node_usage
+        self.load = load
+        self.error = error
+
+
+def ssh_command(node, remote_command):
+    return ['ssh',
+            '-o', 'BatchMode=yes',
+            '-o', 'ConnectTimeout={}'.format(swc.SWS_CONF['PROBE_TIMEOUT']),
+            '-o', 'ControlMaster=auto',
+            '-o', 'ControlPath={}'.format(swc.SWS_CONF['SSH_CONTROL_PATH']),
+            '-o', 'ControlPersist={}'.format(swc.SWS_CONF['SSH_CONTROL_PERSIST']),
+            node] + remote_command
+
+# Returns the stdout of remote_command on node
+def run_on_node(node, remote_command, timeout):
+    result = subprocess.run(ssh_command(node, remote_command), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, timeout=timeout)
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return result.stdout
+
+# Parses nvidia-smi --query-gpu=index,name,utilization.gpu,memory.used,memory.total --format=csv,noheader,nounits
+def parse_gpu_csv(text):
+    gpus = []
+    for line in text.split('\n'):
+        fields = [f.strip() for f in line.split(',')]
+        if len(fields) != 5:
+            continue
+        try:
+            gpus.append(GpuSample(int(fields[0]), fields[1], int(fields[2]), int(fields[3]), int(fields[4])))
+        except ValueError:
+            # [N/A] or [Not Supported] values
+            continue
+    return gpus
+
+def probe_node(node, timeout, remote_command=NVIDIA_SMI_QUERY):
+    try:
+        output = run_on_node(node, remote_command, timeout)
+        gpu_text, sep, load_text = output.partition('LOADAVG')
+        load = float(load_text.split()[0]) if sep != "" and load_text.strip() != "" else None
+        return NodeProbe(node, gpus=parse_gpu_csv(gpu_text), load=load)
+    except subprocess.TimeoutExpired:
+        return NodeProbe(node, error="timed out after {}s".format(timeout))
+    except subprocess.CalledProcessError as e:
+        return NodeProbe(node, error=(e.stderr or "").strip() or "exit code {}".format(e.returncode))
+    except (OSError, ValueError) as e:
+        return NodeProbe(node, error=str(e))
+
+# Samples gpu utilization and cpu load of a node
+def probe_node_usage(node, timeout):
+    return probe_node(node, timeout, USAGE_QUERY)
+
+# Probes all nodes concurrently and returns a dict of node -> NodeProbe
+def probe_nodes(nodes, timeout=None, probe=probe_node):
+    nodes = list(nodes)
+    if len(nodes) == 0:
+        return {}
+    if timeout == None:
+        timeout = swc.SWS_CONF['PROBE_TIMEOUT']
+    workers = min(len(nodes), swc.SWS_CONF['PROBE_WORKERS'])
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda n: probe(n, timeout), nodes)
+        return {p.node: p for p in results}
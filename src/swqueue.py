@@ -33,32 +33,37 @@
 # version 1.0
 #
 
-import subprocess
 import re
-import random
 import argparse
-
-NUM_COMPUTE_NODES = 7
-COMPUTE_NODES = ['hal{}{}'.format("0" if i < 10 else "", i) for i in range(1, 1+NUM_COMPUTE_NODES)]
-
-def display(hide_names, jobid_info, node_info, allowed_users, display_select_users):
-    MAX_PROC = 160
-    BIN_SIZE = 16
-    MAX_NUM_GPUS = 4
-    BARLENGTH = 7
-    DATABARLENGTH = BARLENGTH - 2
-    CGGAP= 4
-    NL = '\n'
-
-    VDIV = "|"
-    HDIV = "-"
-    HDIV2 = "#"
-    LINE_BREAK = (VDIV + HDIV*7) + (VDIV + HDIV*BARLENGTH)*(MAX_PROC//BIN_SIZE) + VDIV*1 + "*"*(CGGAP+1) + VDIV + (HDIV*6 + VDIV)*MAX_NUM_GPUS + (HDIV*7 + VDIV)
-
-    BLACK_TEXT = '\033[30m'
-    WHITE_TEXT = '\033[97m'
-
-    c = {
+import time
+import sys
+import os
+
+import swconfig as swc
+
+from swbackend import get_backend, BACKENDS
+from swhostlist import parse_hostlist
+from swtopology import get_topology, default_node, node_define
+from swjobs import alloc_masks, format_mask
+from swsnapshot import SnapshotWriter, read_header, read_snapshot, is_fresh, snapshot_owner
+from swscreen import Screen
+from swpoll import AdaptivePoller, RpcBudget
+from swprobe import probe_nodes, probe_node, probe_node_usage
+from swusage import UsageTracker, format_usage
+from swstore import JobStore
+from swagg import format_summary
+from swformat import RecordWriter, FORMATS
+from swexporter import serve
+from swestimate import Estimator, partition_request, request_node_types, format_estimates, format_start, format_wait
+from swhistory import HistoryWriter, KINDS, query, format_history
+from swtime import parse_duration, parse_timestamp, parse_window
+from swfederation import Federation, Member
+from swwait import JobWaiter, STATES, ENDED, new_poller, parse_jobids
+
+BLACK_TEXT = '\033[30m'
+WHITE_TEXT = '\033[97m'
+
+COLORS = {
     '':'',
     "NONE" : '',
     "BLINK" : '\033[5m',
@@ -82,370 +87,378 @@ def display(hide_names, jobid_info, node_info, allowed_users, display_select_use
     "BGWHITE" : '\033[107m' + BLACK_TEXT,
 
     "BLINKBGMAGENTA" : '\033[5;45m'
+}
+NO_COLORS = {k: '' for k in COLORS}
+
+# width of the cpu bars on a terminal
+MIN_BAR_COLUMNS = 20
+MAX_BAR_COLUMNS = 160
+
+# Draws the cluster. The frame is composed in full and written at once.
+# Bars are sized to the terminal and the nodes are paged when they do not
+# fit in it, when stdout is not a terminal the classic 80 column frame is
+# written without colors. In monitor mode screen keeps the previous frame
+# and touched the nodes that changed since then, only those rows are redrawn.
+def display(hide_names, jobid_info, node_info, allowed_users, display_select_users, screen=None, touched=None, notes=None):
+    if screen == None:
+        screen = Screen()
+    tty = screen.isatty()
+
+    MAX_NUM_GPUS = max([v['tot_gpu'] for v in node_info.values()] + [0])
+    NAME_WIDTH = max([len(k) for k in node_info] + [5])
+    BARLENGTH = 7
+    CGGAP= 4
+    # columns of a row besides the cpu bar
+    OVERHEAD = 2*NAME_WIDTH + 7*MAX_NUM_GPUS + 14
+    HEADER_LINES = 3
+    LEGEND_LINES = 4
 
-    }
-
-    def colorize(x, params):
-        st = ""
-        for elem in params:
-            st += c[elem] 
-        return "{}{}{}".format(st, x, c["ENDC"])
-
-    def check_load(num):
-        if num == None:
-            return ""
-        
-        MP = MAX_PROC//2
-
-        unit = MP//3
-        retcolor = []
-
-        if num == 0:
-            retcolor += []
-        elif num > 0 and num <= unit:
-            retcolor += ["BGGREEN"]
-        elif num > unit and num <=unit*2 :
-            retcolor += ["BGYELLOW"]
-        elif num > unit*2 and num <= unit*3:
-            retcolor += ["BGRED"]
-        else:
-            retcolor += ["BLINK", "BGMAGENTA"]
-
-        return retcolor
+    width, height = screen.size()
+    BAR_COLUMNS = min(max(width - OVERHEAD, MIN_BAR_COLUMNS), MAX_BAR_COLUMNS) if tty else 80
 
-    def get_load_bar_color(num):
-        if num == None:
-            return ""
+    VDIV = "|"
+    HDIV = "-"
+    TICKS = ((VDIV + HDIV*BARLENGTH) * (BAR_COLUMNS//(BARLENGTH+1) + 1))[:BAR_COLUMNS]
+    LINE_BREAK = VDIV + HDIV*(NAME_WIDTH+2) + TICKS + VDIV + "*"*(CGGAP+1) + VDIV + (HDIV*6 + VDIV)*MAX_NUM_GPUS + HDIV*(NAME_WIDTH+2) + VDIV
 
-        MP = MAX_PROC//2
+    c = COLORS if tty else NO_COLORS
+    allowed_users = set(allowed_users)
 
-        unit = MP//3
-        retcolor = ""
+    def colorize(x, params):
+        return "".join(c[elem] for elem in params) + x + c["ENDC"]
 
+    def load_color(num):
+        unit = BAR_COLUMNS//3
         if num == 0:
-            retcolor += ""
-        elif num > 0 and num <= unit:
-            retcolor += "BGGREEN"
-        elif num > unit and num <=unit*2 :
-            retcolor += "BGYELLOW"
-        elif num > unit*2 and num <= unit*3:
-            retcolor += "BGRED"
-        else:
-            retcolor += "BLINK" + "BGMAGENTA"
-
-        return retcolor
-
+            return []
+        elif num <= unit:
+            return ["BGGREEN"]
+        elif num <= unit*2:
+            return ["BGYELLOW"]
+        elif num <= unit*3:
+            return ["BGRED"]
+        return ["BLINK", "BGMAGENTA"]
+
+    # The message over a bar of BAR_COLUMNS+1 columns whose first
+    # split_index columns are colored. Without colors the bar is drawn
+    # with '=' behind the message.
     def bar_msg_format(msg, split_index, color):
-
-        MP = MAX_PROC // 2
-
-        if len(msg) >= 93:
-            msg = msg[0:92] + '...'
-
-        msg2 = [" "]*(MP+1)
-        for i in range(1, MP):
-            if i-1 < len(msg):
-                msg2[i] = msg[i-1]
-        msg2 = "".join(msg2)
-
-        flag = False
-        new_msg = color
-        for i in range(len(msg2)):
-            if i == split_index:
-                new_msg += c["ENDC"] + msg2[i]
-                flag = True
-            else:
-                new_msg += msg2[i]
-
-        if flag == False:
-            new_msg = new_msg[0:MP+1] + c['ENDC']
-        # print(len(new_msg))
-        return new_msg
-
-
-    ############### Testing ###################
-    def get_dummy_gpu():
-        return [False if random.randint(0,99999) % 2 == 0 else True for i in range(MAX_NUM_GPUS+1) ]
-
-    def get_dummy_cpu():
-        return random.randint(0,MAX_PROC+1)
-
-    # all_cpus = [get_dummy_cpu() for i in range(NUM_COMPUTE_NODES) ]
-    # all_gpus = [get_dummy_gpu() for i in range(NUM_COMPUTE_NODES) ]
-    # # messages = ["hongyu2 dmu dash3 tlim33" + "k"*90 for i in range(NUM_COMPUTE_NODES)]
-    # messages = ["hongyu2 dmu dash3 tlim33" for i in range(NUM_COMPUTE_NODES)]
-
-    all_cpus = [0 for i in range(NUM_COMPUTE_NODES)]
-    all_gpus = [0 for i in range(NUM_COMPUTE_NODES)]
-    messages = ["" for i in range(NUM_COMPUTE_NODES)]
-    ctr = 0
-    for k,v in node_info.items():
-        all_cpus[ctr] = v['cpus'] // 2
-        all_gpus[ctr] = [True if i < v['gpus'] else False for i in range(MAX_NUM_GPUS)]
+        if len(msg) > BAR_COLUMNS - 1:
+            msg = msg[:BAR_COLUMNS-4] + '...'
+        text = (" " + msg).ljust(BAR_COLUMNS + 1)
+        if tty == False:
+            used = len(msg) + 1
+            if split_index > used:
+                text = text[:used] + "="*(split_index - used) + text[split_index:]
+            return text
+        return color + text[:split_index] + c["ENDC"] + text[split_index:]
+
+    def node_message(v):
+        parts = []
+        if 'down' in v['state'] or 'drain' in v['state']:
+            parts.append("[{}] ".format(v['state'].upper()))
         for (jobid, user) in v['users_jobids']:
             if display_select_users == True:
-                messages[ctr] += "{} {} c:{} g:{}, ".format(user, jobid, jobid_info[jobid]['cpus'], jobid_info[jobid]['gpus']) if user in allowed_users else ""
+                if user in allowed_users:
+                    parts.append("{} {} c:{} g:{}, ".format(user, jobid, jobid_info[jobid]['cpus'], jobid_info[jobid]['gpus']))
             else:
-                messages[ctr] += "{} {}, ".format(user, jobid)
-
-        ctr += 1
-
-    ###########################################
-
-    subprocess.run(['clear'])
-
-    final_strings_list = [LINE_BREAK]
-    print(LINE_BREAK)
-    print("| nodes | 1{}CPUS{}64{}128{}160{}| 1{}GPUS{}4{} | nodes |".format("."*12, "."*13, "."*30, "."*13, " "*(CGGAP-1), "."*9, "."*10, " "*0))
-    print(LINE_BREAK)
-    for i in range(NUM_COMPUTE_NODES):
-        node_line = " " + colorize("hal{}{}", check_load(all_cpus[i])).format("0" if i+1 < 10 else "", i+1) + " "
-
-        ###### INITIAL ######
-        print(VDIV + node_line + VDIV, end="")
-        line = VDIV + node_line + VDIV
+                parts.append("{} {}, ".format(user, jobid))
+        return "".join(parts)
+
+    def gpu_cell(g, busy, stranded):
+        label = "GPU{}".format(g+1)
+        if tty == False:
+            return ("*{}*" if busy else "~{}~" if stranded else " {} ").format(label)
+        return colorize(" {} ".format(label), ["BGCYAN"] if busy else ["YELLOW"] if stranded else ["NONE"])
+
+    def node_row(name, v):
+        load = v['cpus'] * BAR_COLUMNS // max(v['tot_cpu'], 1)
+        if v['cpus'] > 0 and load == 0:
+            load = 1
+        gpus = gpu_usage(v)
+        stranded = stranded_gpus(v['node_type'], gpus)
+        node_line = " " + colorize(name.ljust(NAME_WIDTH), load_color(load)) + " "
 
         ### CPU & MESSAGE ###
-        cur_load = (all_cpus[i] if all_cpus[i] <= MAX_PROC else MAX_PROC)
-        bar_color_code = get_load_bar_color(cur_load) if all_cpus[i] <= MAX_PROC else "BLINK" + "BGMAGENTA"
-
-        message = bar_msg_format(messages[i], split_index=cur_load, color=c[bar_color_code])
-        line += colorize(" ", params=[bar_color_code])* cur_load
-        if hide_names == True:
-            print(colorize(" ", params=[bar_color_code])* cur_load, end="")
-        else:
-            print(message, end="")
-        space = (MAX_PROC + 1 - cur_load)
-        line += " "*space
-        # print(" "*(99-len(message)), end="")
-        line += "-"*CGGAP
-        print("-"*CGGAP, end="")
-
+        cur_load = min(load, BAR_COLUMNS)
+        bar_color = "".join(c[elem] for elem in load_color(load))
+        msg = "" if hide_names == True else node_message(v)
+        parts = [VDIV, node_line, VDIV, bar_msg_format(msg, cur_load, bar_color), "-"*CGGAP, VDIV]
 
         ###### GPUS ##########
-        # line += VDIV
-        print(VDIV, end="")
-        gpus = all_gpus[i]
         for g in range(len(gpus)):
-            gpu_color = ["BGCYAN"] if gpus[g] == True else ["NONE"]
-            line += colorize("   GPU{}  ".format(g+1), gpu_color) + VDIV
-            print(colorize(" GPU{} ".format(g+1), gpu_color) + VDIV, end="")
-
-        ##### FINAL END ######
-        line += "->" + node_line + VDIV
-        print(node_line + VDIV, end="\n")
-
-        final_strings_list.append(line)
-        final_strings_list.append(LINE_BREAK)
-        print(LINE_BREAK)
-
-    # for line in final_strings_list:
-    #   print("{}{}{}".format(c["NONE"], line, c["ENDC"]))
-
-    print("\nLegend: {} {}->{} {}->{} {} means lower to higher usage and {} {} means above expected usage.\n        Whereas {} {} means that a GPU is being {}USED{}.\n".format(c["BGGREEN"], c["ENDC"], c["BGYELLOW"], c["ENDC"], c["BGRED"], c["ENDC"], c["BGMAGENTA"] + c["BLINK"], c["ENDC"], c["BGCYAN"], c["ENDC"], c["BOLDUNDERLINED"], c["ENDC"]))
-
-
-def display_full_nodes(node_info, nodes_to_display):
-    for k,v in node_info.items():
-        if k in nodes_to_display:
-            print(k)
-            print(v)
-            subprocess.run(['ssh', k, 'nvidia-smi'])
-            
-def display_full_user(job_info, users_to_display):
-    for k,v in job_info.items():
-        if v['users'][0] in users_to_display and v['state'] == 'RUNNING':
-            print(k)
-            print(v)
-
-
-def lprint(data):
-    for line in data:
-        print(line)
-
-def reformat(data, divider):
-    return str(data)[2:-1].split(divider)
-
-def split_frames(m_data):
-    x = []
-    indices = []
-    for i in range(len(m_data)):
-        line = m_data[i]
-        for l in line:
-            if 'JobId' in l:
-                indices.append(i)
-
-    for i in range(len(indices)):
-        if i+1 < len(indices):
-            indices[i] = (indices[i], indices[i+1])
-    #print(len(m_data))
-    #exit()
-    if len(m_data)==1:
-        print("|")
-        print("|    NO JOB RUNNING...")
-        print("|")
-        exit()
-    indices[-1] = (indices[-1], len(m_data))
-
-    frames = []
-    for i in indices:
-        frames.append(m_data[i[0]:i[1]])
-
-    return frames
-
-def get_nodes_from_range(node_range):
-    node_range_list = node_range.split('-')
-    start = int(node_range_list[0])
-    end = int(node_range_list[1])
-    nodes = [i for i in range(start, end+1)]
-    return nodes
-
-def get_nodes(info):
-    nodes = []
-    if info[0] == '[':
-        info = info.replace('[', '').replace(']', '').split(',')
-        for elem in info:
-            if '-' in elem:
-                nodes.extend(get_nodes_from_range(elem))
-            else:
-                nodes.append(int(elem))
+            parts.append(gpu_cell(g, gpus[g], g in stranded))
+            parts.append(VDIV)
+        for g in range(len(gpus), MAX_NUM_GPUS):
+            parts.append(" "*6 + VDIV)
+
+        parts.append(node_line)
+        parts.append(VDIV)
+        return "".join(parts)
+
+    # rows of nodes that did not change since the last frame are reused,
+    # unless the frame geometry changed
+    geometry = (BAR_COLUMNS, NAME_WIDTH, MAX_NUM_GPUS, tty, hide_names)
+    if screen.geometry != geometry:
+        screen.rows = {}
+        screen.geometry = geometry
+    rows = {}
+    for name, v in node_info.items():
+        if touched != None and name not in touched and name in screen.rows:
+            rows[name] = screen.rows[name]
+        else:
+            rows[name] = node_row(name, v)
+    screen.rows = rows
+
+    # one row and one line break per node if they fit, only rows if that
+    # fits, otherwise pages of rows shown one after the other by -m
+    names = list(node_info)
+    room = height - 1 - HEADER_LINES - LEGEND_LINES if tty else len(names) * 2
+    spaced = len(names) * 2 <= room
+    per_page = len(names) if spaced or len(names) <= room else max(room - 1, 1)
+    screen.pages = (len(names) + per_page - 1) // per_page if len(names) > 0 else 1
+    page = screen.page % screen.pages
+    screen.page += 1
+
+    cpu_header = (" 0%" + "CPUS".center(BAR_COLUMNS-6, ".") + "100%").ljust(BAR_COLUMNS+1)
+    gpu_header = "GPUS".center(7*MAX_NUM_GPUS-1, ".") + VDIV if MAX_NUM_GPUS > 0 else ""
+    lines = [LINE_BREAK,
+             "| {} |{}{}{}{} {} |".format("nodes".center(NAME_WIDTH), cpu_header, " "*CGGAP, VDIV, gpu_header, "nodes".center(NAME_WIDTH)),
+             LINE_BREAK]
+    for name in names[page*per_page:(page+1)*per_page]:
+        lines.append(rows[name])
+        if spaced:
+            lines.append(LINE_BREAK)
+    if spaced == False:
+        lines.append(LINE_BREAK)
+    if screen.pages > 1:
+        lines.append("page {}/{}, nodes {}-{} of {}".format(page+1, screen.pages, page*per_page+1,
+                                                           min((page+1)*per_page, len(names)), len(names)))
+    if notes != None:
+        lines.extend(notes)
+
+    if tty:
+        lines.extend("\nLegend: {} {}->{} {}->{} {} means lower to higher usage and {} {} means above expected usage.\n        Whereas {} {} means that a GPU is being {}USED{}, {}GPUn{} that it is free but its NVLink partner is not.\n".format(c["BGGREEN"], c["ENDC"], c["BGYELLOW"], c["ENDC"], c["BGRED"], c["ENDC"], c["BGMAGENTA"] + c["BLINK"], c["ENDC"], c["BGCYAN"], c["ENDC"], c["BOLDUNDERLINED"], c["ENDC"], c["YELLOW"], c["ENDC"]).split("\n"))
     else:
-        #nodes = [int(info)]
-        nodes = [info]
-
-    nodes = [COMPUTE_NODES[i-1] for i in nodes]
-    return nodes
-
-def get_node_to_resource_mapping(running_jobs):
-    info_dict = {}
-    for node in COMPUTE_NODES:
-        info_dict[node] = {'cpus':0, 'gpus':0, 'users_jobids':[]}
-
-    for k,v in running_jobs.items():
-        for frame in v:
-            # Process a frame below
-            job_id = 0
-            for line in frame:
-                # numnodes = 1
-                for item in line:
-                    if 'JobId=' in item:
-                        job_id = int(item.split('=')[1])
-                    if 'UserId=' in item:
-                        uid = item.split('=')[1]
-                        user = uid.split('(')[0]
-                        info_dict[k]['users_jobids'].append((job_id, user))
-
-                    numnodes = 1
-                    numcpus = 1
-                    if 'TRES=' in item:
-                        subitem = item.split(',')
-                        for s in subitem:
-                            if 'gres/gpu=' in s:
-                                info_dict[k]['gpus'] += int(s.split('=')[1])
-                            if 'cpu=' in s:
-                                numcpus = int(s.split('=')[2])
-                            if 'node=' in s:
-                                numnodes = int(s.split('=')[1])
-                        info_dict[k]['cpus'] += (numcpus//numnodes)
-
-    return info_dict
-
-def get_jobid_to_resouce_mapping(jobs):
-    info_dict = {}
-
-    for k,frame in jobs.items():
-        # for frame in v:
-        #     # Process a frame below
-        #     print(frame)
-        job_id = 0
-        for line in frame:
-            numnodes = 1
-            for item in line:
-                if 'JobId=' in item:
-                    job_id = int(item.split('=')[1])
-                    info_dict[job_id] = {'state':'UNKNOWN', 'cpus':0, 'gpus':0, 'users':[], 'nodes': [], 'submit_time':0, 'start_time':0, 'time_limit':0}
-
-                if 'UserId=' in item:
-                    uid = item.split('=')[1]
-                    user = uid.split('(')[0]
-                    info_dict[k]['users'].append(user)
-
-                numnodes = 1
-                numcpus = 1
-                if 'TRES=' in item:
-                    subitem = item.split(',')
-                    for s in subitem:
-                        if 'gres/gpu=' in s:
-                            info_dict[k]['gpus'] += int(s.split('=')[1])
-                        if 'cpu=' in s:
-                            numcpus = int(s.split('=')[2])
-                        if 'node=' in s:
-                            numnodes = int(s.split('=')[1])
-                    info_dict[k]['cpus'] += (numcpus//numnodes)
-
-                if 'JobState=' in item:
-                    info_dict[k]['state'] = item.split('=')[1]
-                if 'SubmitTime=' in item:
-                    info_dict[k]['submit_time'] = item.split('=')[1]
-                if 'StartTime=' in item:
-                    info_dict[k]['start_time'] = item.split('=')[1]
-                if 'NodeList=hal' in item:
-                    info_dict[k]['nodes'] = get_nodes(item.split("=hal")[1])
-                if 'TimeLimit=' in item:
-                    info_dict[k]['time_limit'] = item.split('=')[1]
-
-    # for k,v in info_dict.items():
-    #     print(k)
-    #     print(v)
-
-    return info_dict
-
-def process_frames(frames):
+        lines.extend("\nLegend: '=' is the share of allocated cpus, *GPUn* a GPU in use, ~GPUn~ a free GPU whose NVLink partner is not.\n".split("\n"))
+
+    screen.draw(lines)
+
+
+# Busy flag of every gpu of a node. The gpu bitmap is exact when scontrol
+# gave the gpu indices of all jobs on the node, otherwise gpus are assumed
+# to fill up from index 0.
+def gpu_usage(v):
+    mask = v['gpu_mask']
+    if bin(mask).count('1') == v['gpus']:
+        return [(mask >> i) & 1 == 1 for i in range(v['tot_gpu'])]
+    return [i < v['gpus'] for i in range(v['tot_gpu'])]
+
+# Free gpus whose NVLink partner is busy, they cannot serve a job that
+# needs a connected pair
+def stranded_gpus(node_type, gpus):
+    stranded = set()
+    for a, b in node_define(node_type).get('gpu_pairs', []):
+        if b < len(gpus) and gpus[a] != gpus[b]:
+            stranded.add(a if gpus[b] == True else b)
+    return stranded
+
+def free_gpu_pairs(node_type, gpus):
+    return len([1 for a, b in node_define(node_type).get('gpu_pairs', []) if b < len(gpus) and not gpus[a] and not gpus[b]])
+
+# Probes the hosts of nodes, the nodes of a multi-cluster view are named
+# cluster:host
+def probe_hosts(node_info, nodes, probe=probe_node):
+    hosts = {k: node_info[k].get('host', k) for k in nodes}
+    probes = probe_nodes(set(hosts.values()), probe=probe)
+    return {k: probes[h] for k, h in hosts.items()}
+
+def display_full_nodes(node_info, store, nodes_to_display):
+    nodes = [k for k in nodes_to_display if k in node_info]
+    probes = probe_hosts(node_info, nodes)
+    for k in nodes:
+        v = node_info[k]
+        print(k)
+        print(v)
+        print("  allocated: cpus {}/{} gpus {}/{}".format(v['cpus'], v['tot_cpu'], v['gpus'], v['tot_gpu']))
+        gpus = gpu_usage(v)
+        print("  cpu ids in use: {}  gpu indices in use: {}  free NVLink pairs: {}".format(
+            format_mask(v['cpu_mask']) or "-", ",".join(str(i) for i in range(len(gpus)) if gpus[i]) or "-",
+            free_gpu_pairs(v['node_type'], gpus)))
+        print("  jobs: {}".format(", ".join("{} {} {}".format(j, store[j]['users'][0], store[j]['partition'])
+                                            for j in store.select(node=k)) or "-"))
+        if probes[k].error != "":
+            print("  nvidia-smi failed: {}".format(probes[k].error))
+        for g in probes[k].gpus:
+            print("  GPU{} {:<24} util {:>3}%  mem {:>6}/{:<6} MiB".format(g.index, g.name, g.util, g.mem_used, g.mem_total))
+
+# Samples the real gpu and cpu usage of the nodes running gpu jobs and
+# prints it next to what the jobs were allocated
+def display_usage(node_info, jobid_info, tracker, samples, interval):
+    nodes = [k for k, v in node_info.items() if v['gpus'] > 0]
+    rows = []
+    for i in range(samples):
+        if i > 0:
+            time.sleep(interval)
+        probes = probe_hosts(node_info, nodes, probe=probe_node_usage)
+        rows = tracker.add_sample(node_info, jobid_info, probes, time.time())
+    print(format_usage(rows, tracker))
+
+# Cpu and gpu totals per partition and user, job counts and the node load
+# histogram, totals being the store totals kept up to date by the refreshes
+def display_summary(node_info, totals):
+    print(format_summary(totals, {name: v['tot_cpu'] for name, v in node_info.items()}))
+
+# Expected start of the pending jobs and, given a partition, of a job
+# asking for it now on node_type (see swestimate.request_node_types)
+def display_estimates(node_info, jobid_info, partition, hours, node_type=None, cluster=None):
+    now = time.time()
+    if cluster != None:
+        print("Cluster {}:".format(cluster))
+    est = Estimator(node_info, jobid_info, now)
+    starts = est.pending(jobid_info)
+    print(format_estimates(jobid_info, starts, now))
+    for t in request_node_types(node_info, node_type) if partition != "" else []:
+        request = partition_request(partition, hours, node_type=t)
+        start, nodes = est.earliest(request)
+        print("\n{} for {}h ({} {} node(s) of partition {}, {} cpus and {} gpus each) submitted now: expected start {}, wait {}".format(
+            partition, hours if hours != None else swc.SWS_CONF['HOURS_DEFAULT'], request.num_nodes, request.node_type,
+            request.partition, request.cpus, request.gpus, format_start(start), format_wait(start, now)))
+
+def display_history(kind, since):
+    start = time.time()
+    usage, covered = query(swc.SWS_CONF['HISTORY_DIR'], kind, since)
+    print(format_history(usage, covered, kind, since))
+    print("({:.1f} ms)".format((time.time() - start) * 1000))
+
+def display_full_user(store, users_to_display):
+    for k in store.select(user=users_to_display, state='RUNNING'):
+        print(k)
+        print(store[k])
+
+
+def new_node_entry(node):
+    return {'cpus':0, 'gpus':0, 'users_jobids':[], 'node_type':node.node_type,
+            'tot_cpu':node.tot_cpu, 'tot_gpu':node.tot_gpu, 'state':node.state,
+            'cpu_mask':0, 'gpu_mask':0,
+            'partitions':[p for p in node.partitions.split(',') if p != ""]}
+
+def new_node_info(topology):
+    node_info = {}
+    for name, node in topology.items():
+        node_info[name] = new_node_entry(node)
+    return node_info
+
+# Adds (sign=1) or removes (sign=-1) a running job on the nodes it runs on
+def update_nodes(node_info, jobid, job, sign):
+    nodes = job['nodes']
+    num_nodes = max(len(nodes), 1)
+    masks = alloc_masks(job['alloc'])
+    for n in nodes:
+        if n not in node_info:
+            node_info[n] = new_node_entry(default_node(n))
+        entry = node_info[n]
+        entry['cpus'] += sign * job['cpus']
+        entry['gpus'] += sign * (job['gpus'] // num_nodes)
+        cpu_mask, gpu_mask = masks.get(n, (0, 0))
+        if sign > 0:
+            entry['users_jobids'].append((jobid, job['users'][0]))
+            entry['cpu_mask'] |= cpu_mask
+            entry['gpu_mask'] |= gpu_mask
+        else:
+            entry['users_jobids'].remove((jobid, job['users'][0]))
+            entry['cpu_mask'] &= ~cpu_mask
+            entry['gpu_mask'] &= ~gpu_mask
+
+# Takes the job records as they are parsed and builds, in a single pass,
+# the per job info of running and pending jobs. on_job is called with every
+# job as soon as it is parsed.
+def process_jobs(records, on_job=None):
+    jobid_info = {}
+    for rec in records:
+        if rec.state != 'RUNNING' and rec.state != 'PENDING':
+            continue
+        job = jobid_info[rec.jobid] = {'state':rec.state, 'cpus':rec.cpus // rec.num_nodes, 'gpus':rec.gpus,
+                                 'users':[rec.user], 'partition':rec.partition, 'num_nodes':rec.num_nodes,
+                                 'priority':rec.priority, 'nodes':parse_hostlist(rec.nodelist), 'submit_time':rec.submit_time,
+                                 'start_time':rec.start_time, 'time_limit':rec.time_limit, 'alloc':rec.alloc,
+                                 'submit_epoch':parse_timestamp(rec.submit_time), 'start_epoch':parse_timestamp(rec.start_time),
+                                 'limit_seconds':parse_duration(rec.time_limit)}
+        if on_job != None:
+            on_job(rec.jobid, job)
+    return jobid_info
+
+# Builds the per node usage of running jobs and the per job info of
+# running and pending jobs
+def process_frames(records, topology):
     # map jobs to job info
-    jobs = {}
-    # map hal nodes to complete job info of running jobs
+    jobid_info = process_jobs(records)
+    # map nodes to the resources used by running jobs
     # to create a picture of resource utilization
-    running_jobs = {}
-
-    for line in frames:
-        consider = False
-        for entry in line:
-            for label in entry:
-                if label == 'JobState=RUNNING':
-                    consider = True
-
-                if 'NodeList=hal' in label and consider == True:
-                    nodes = get_nodes(label.split("=hal")[1])
-                    for n in nodes:
-                        if n not in running_jobs:
-                            running_jobs[n] = [line]
-                        else:
-                            running_jobs[n].append(line)
-
-                if label == 'JobState=RUNNING' or label == 'JobState=PENDING':
-                    line1 = line[0]
-                    for elem in line1:
-                        if 'JobId' in elem:
-                            jobid = int(elem.split('=')[1])
-                            jobs[jobid] = line
-
-    node_info = get_node_to_resource_mapping(running_jobs)
-    jobid_info = get_jobid_to_resouce_mapping(jobs)
+    node_info = new_node_info(topology)
+    for jobid, job in jobid_info.items():
+        if job['state'] == 'RUNNING':
+            update_nodes(node_info, jobid, job, 1)
 
     return node_info, jobid_info
 
 
+# Jobs that appeared, disappeared or changed state or resources between
+# two refreshes
+def diff_jobs(old_jobs, new_jobs):
+    diff = {'added':[], 'removed':[], 'changed':[]}
+    for jobid, job in new_jobs.items():
+        if jobid not in old_jobs:
+            diff['added'].append(jobid)
+        elif old_jobs[jobid] != job:
+            diff['changed'].append(jobid)
+    for jobid in old_jobs:
+        if jobid not in new_jobs:
+            diff['removed'].append(jobid)
+    return diff
+
+# Updates node_info in place with a job diff, only the nodes of the jobs
+# in the diff are recomputed. Returns the cpu and gpu delta of each of them.
+def apply_job_diff(node_info, old_jobs, new_jobs, diff):
+    leaving = [(j, old_jobs[j]) for j in diff['removed'] + diff['changed'] if old_jobs[j]['state'] == 'RUNNING']
+    arriving = [(j, new_jobs[j]) for j in diff['added'] + diff['changed'] if new_jobs[j]['state'] == 'RUNNING']
+
+    before = {}
+    for jobid, job in leaving + arriving:
+        for n in job['nodes']:
+            if n not in before:
+                before[n] = (node_info[n]['cpus'], node_info[n]['gpus']) if n in node_info else (0, 0)
+
+    for jobid, job in leaving:
+        update_nodes(node_info, jobid, job, -1)
+    for jobid, job in arriving:
+        update_nodes(node_info, jobid, job, 1)
+
+    deltas = {}
+    for n, (cpus, gpus) in before.items():
+        deltas[n] = (node_info[n]['cpus'] - cpus, node_info[n]['gpus'] - gpus)
+    return deltas
+
+# Nodes whose entries differ between two node_info
+def diff_nodes(old_nodes, new_nodes):
+    touched = set()
+    for name, v in new_nodes.items():
+        if old_nodes.get(name) != v:
+            touched.add(name)
+    return touched
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("-s", "--show", 
         help="Show a stylized view of the cluster with the cpu and gpu usage across all nodes.", 
         action="store_true")
     parser.add_argument("-t", "--timestep", 
-        help="Specify delay of update in seconds(>= 60s), by default updates occur every 60 seconds.", 
+        help="Longest delay between updates in seconds, 60 seconds by default. Updates come faster while jobs are changing.", 
         type=int,
         default=60)
     parser.add_argument("-m", "--monitor", 
-        help="Monitor the cluster at a refresh rate either dafaulted at 60 seconds or specified by user (lower limit of 60s).", 
+        help="Monitor the cluster, refreshing every POLL_MIN_INTERVAL seconds while jobs change and backing off up to the timestep when nothing does.", 
         action="store_true")
     parser.add_argument("-u", "--users", 
         help="Monitor by users", 
@@ -456,14 +469,245 @@ def parse_args():
     parser.add_argument("-n", "--nodev", 
         help="Check some nodes verbosely if they don't fit in the line of colorized output", 
         nargs='+')
+    parser.add_argument("-M", "--clusters",
+        help="Comma separated clusters to show in one view, e.g. -M delta,hal. The clusters are queried at the same time and one that fails or does not answer within CLUSTER_TIMEOUT seconds keeps its last state.",
+        default=None)
+    parser.add_argument("-b", "--backend",
+        help="Where to read the cluster state from: scontrol (default), json (squeue --json) or file.",
+        choices=list(BACKENDS),
+        default="scontrol")
+    parser.add_argument("--fixture",
+        help="Replay a saved scontrol or squeue --json dump instead of querying slurm, e.g. scontrol_sample_data.txt",
+        default=None)
+    parser.add_argument("--collect",
+        help="Run as the collector: poll slurm every SNAPSHOT_INTERVAL seconds and publish a snapshot for all other swqueue runs.",
+        action="store_true")
+    parser.add_argument("--no-snapshot",
+        help="Query slurm directly even if a collector publishes a snapshot.",
+        dest="no_snapshot",
+        action="store_true")
+    parser.add_argument("--summary",
+        help="Print the allocated cpus and gpus per partition and user, the number of jobs per state and a histogram of the node loads.",
+        action="store_true")
+    parser.add_argument("--format",
+        help="Write the jobs and nodes as json, jsonl or csv records instead of drawing them. Jobs are written while slurm's answer is parsed, with -m every refresh writes the jobs and nodes that changed.",
+        choices=FORMATS,
+        default=None)
+    parser.add_argument("--serve",
+        help="Serve per node, partition and user allocations, job counts and pending times in the Prometheus text format, refreshed every EXPORTER_INTERVAL seconds.",
+        action="store_true")
+    parser.add_argument("--port",
+        help="Port of --serve, EXPORTER_PORT by default.",
+        type=int,
+        default=None)
+    parser.add_argument("--history",
+        help="Print the cpu and gpu hours recorded by the collector since --since, grouped by --by.",
+        action="store_true")
+    parser.add_argument("--since",
+        help="Start of the --history window as a duration before now, e.g. 12h, 7d or 2w. 1d by default.",
+        default="1d")
+    parser.add_argument("--by",
+        help="Grouping of --history: user (default), node or partition.",
+        choices=KINDS,
+        default="user")
+    parser.add_argument("--estimate",
+        help="Estimate when the pending jobs start, and when a job asking for PARTITION (e.g. gpux4) now would.",
+        nargs='?',
+        const="",
+        default=None,
+        metavar="PARTITION")
+    parser.add_argument("--hours",
+        help="Time limit in hours of the --estimate PARTITION request, HOURS_DEFAULT by default.",
+        type=float,
+        default=None)
+    parser.add_argument("--node_type",
+        help="Node type of the --estimate PARTITION request: x86, ppc64le, arm. By default NODE_TYPE_DEFAULT, or the node types of the cluster if it has none of those.",
+        choices=swc.SWS_CONF['ALLOWED_NODE_TYPE'],
+        default=None)
+    parser.add_argument("--wait",
+        help="Wait until the given jobs reach the --until state, printing their state changes. All jobs share one query per refresh, read from the collector snapshot when there is one.",
+        nargs='+',
+        metavar="JOBID")
+    parser.add_argument("--until",
+        help="State --wait waits for: RUNNING or ENDED (default). A job that left the queue is ENDED and always ends the wait.",
+        choices=STATES,
+        default=ENDED)
+    parser.add_argument("--timeout",
+        help="Give up --wait after this many seconds and exit with 1.",
+        type=float,
+        default=None)
+    parser.add_argument("--idle",
+        help="Sample the real GPU utilization and CPU load of running jobs, flag jobs holding idle GPUs and report wasted GPU-hours per user.",
+        action="store_true")
 
     return parser.parse_args()
 
 
+# Collector mode: the only process that talks to slurm, every other
+# swqueue reads the snapshot it publishes. Every refresh is also added to
+# the utilization history.
+def collect(backend, offline):
+    writer = SnapshotWriter(swc.SWS_CONF['SNAPSHOT_PATH'], snapshot_owner(swc.SWS_CONF['SNAPSHOT_OWNER']))
+    history = HistoryWriter(swc.SWS_CONF['HISTORY_DIR'], swc.SWS_CONF['SNAPSHOT_INTERVAL'],
+                            swc.SWS_CONF['HISTORY_COMPACT_INTERVAL'], swc.SWS_CONF['HISTORY_RETENTION_DAYS'])
+    state = ClusterState()
+    while True:
+        load_cluster_state(backend, offline, False, state)
+        writer.publish(state.node_info, state.jobid_info)
+        history.append(time.time(), state.node_info, state.store.totals)
+        time.sleep(swc.SWS_CONF['SNAPSHOT_INTERVAL'])
+
+# Exporter mode: scrapes are answered from metrics rendered after every
+# refresh of state, never from a scheduler query of their own
+def serve_metrics(backend, offline, use_snapshot, state, port):
+    budget = new_budget(offline)
+
+    def load():
+        if type(state) == Federation:
+            state.refresh()
+        else:
+            load_cluster_state(backend, offline, use_snapshot, state, budget)
+        return state.node_info, state.jobid_info, state.store.totals
+
+    serve(load, swc.SWS_CONF['EXPORTER_ADDRESS'], port if port != None else swc.SWS_CONF['EXPORTER_PORT'],
+          swc.SWS_CONF['EXPORTER_INTERVAL'], swc.SWS_CONF['QUEUE_AGE_BUCKETS'])
+
+# Limits the scheduler queries of this user, every cluster of -M has a
+# budget of its own
+def new_budget(offline, cluster=None):
+    if offline == True:
+        return None
+    path = swc.SWS_CONF['RPC_BUDGET_FILE'].format(os.getuid())
+    return RpcBudget(path if cluster == None else "{}.{}".format(path, cluster),
+                     swc.SWS_CONF['RPC_BUDGET_PER_MINUTE'], swc.SWS_CONF['RPC_BUDGET_BURST'])
+
+# Multi-cluster view, the collector snapshot only holds the local cluster
+# so the clusters are always queried directly
+def new_federation(clusters, backend_name, fixture, offline):
+    members = [Member(c, get_backend(backend_name, fixture, c), new_budget(offline, c), ClusterState()) for c in clusters]
+
+    def load(m):
+        return load_cluster_state(m.backend, offline, False, m.state, m.budget)
+
+    return Federation(members, load, swc.SWS_CONF['CLUSTER_TIMEOUT'])
+
+# swqueue --wait, returns the exit code: 0 once all jobs reached until, 1
+# on timeout, 2 when the queue could not be read WAIT_MAX_FAILURES times
+# in a row
+def wait_jobs(backend, offline, use_snapshot, state, jobids, until, timeout, max_interval):
+    budget = new_budget(offline)
+
+    def load():
+        if type(state) == Federation:
+            state.refresh()
+        else:
+            load_cluster_state(backend, offline, use_snapshot, state, budget)
+        return state.jobid_info
+
+    def report(jobid, old, new):
+        print("{} {} {} -> {}".format(time.strftime('%H:%M:%S'), jobid, old or "-", new))
+        sys.stdout.flush()
+
+    def report_error(error, failures):
+        sys.stderr.write("swqueue --wait: cannot read the queue ({}/{}): {}\n".format(
+            failures, swc.SWS_CONF['WAIT_MAX_FAILURES'], error))
+        sys.stderr.flush()
+
+    waiter = JobWaiter(load, new_poller(max_interval), swc.SWS_CONF['WAIT_MAX_FAILURES'], report_error)
+    done, states = waiter.wait(jobids, [until], timeout, report)
+    if waiter.failures >= swc.SWS_CONF['WAIT_MAX_FAILURES']:
+        sys.stderr.write("swqueue --wait: giving up after {} failed reads of the queue\n".format(waiter.failures))
+        return 2
+    if done == False:
+        print("timed out after {:.0f}s waiting for {}".format(timeout, ", ".join(
+            str(j) for j in jobids if states.get(j) not in (until, ENDED))))
+        return 1
+    return 0
+
+# What swqueue -m remembers between two refreshes
+class ClusterState:
+
+    def __init__(self):
+        self.generation = None
+        self.topology_key = None
+        self.node_info = None
+        self.jobid_info = None
+        self.store = JobStore()
+
+# Only the static fields, a change of node state does not rebuild node_info
+def topology_key(topology):
+    return [(n.name, n.node_type, n.tot_cpu, n.tot_gpu, n.partitions) for n in topology.values()]
+
+# Copies the node states of topology into node_info and returns the nodes
+# whose state changed
+def update_node_states(node_info, topology):
+    changed = set()
+    for name, node in topology.items():
+        v = node_info[name]
+        if v['state'] != node.state:
+            v['state'] = node.state
+            changed.add(name)
+    return changed
+
+# Refreshes state and returns (changed, touched), touched being the nodes
+# whose rows have to be redrawn or None to redraw everything. The state
+# comes from the collector snapshot when there is a fresh one and from
+# slurm otherwise. Only the nodes of the jobs that changed are recomputed.
+def load_cluster_state(backend, offline, use_snapshot, state, budget=None, on_job=None):
+    if use_snapshot == True:
+        owner = snapshot_owner(swc.SWS_CONF['SNAPSHOT_OWNER'])
+        header = read_header(swc.SWS_CONF['SNAPSHOT_PATH'], owner)
+        if is_fresh(header, swc.SWS_CONF['SNAPSHOT_MAX_AGE']):
+            if header[0] == state.generation:
+                return False, set()
+            snap = read_snapshot(swc.SWS_CONF['SNAPSHOT_PATH'], owner)
+            if snap != None:
+                touched = diff_nodes(state.node_info, snap.node_info) if state.node_info != None else None
+                state.generation = snap.generation
+                state.topology_key = None
+                state.node_info = snap.node_info
+                if state.jobid_info != None:
+                    state.store.apply(snap.jobid_info, diff_jobs(state.jobid_info, snap.jobid_info))
+                else:
+                    state.store.load(snap.jobid_info)
+                state.jobid_info = snap.jobid_info
+                return True, touched
+
+    if budget != None:
+        budget.wait()
+    topology = get_topology(offline=offline, cluster=backend.cluster)
+    key = topology_key(topology)
+    jobid_info = process_jobs(backend.job_records(), on_job)
+    state.generation = None
+
+    diff = diff_jobs(state.jobid_info, jobid_info) if state.jobid_info != None else None
+    if diff != None:
+        state.store.apply(jobid_info, diff)
+    else:
+        state.store.load(jobid_info)
+
+    if state.node_info != None and key == state.topology_key:
+        touched = update_node_states(state.node_info, topology)
+        if len(diff['added']) + len(diff['removed']) + len(diff['changed']) == 0:
+            return len(touched) > 0, touched
+        deltas = apply_job_diff(state.node_info, state.jobid_info, jobid_info, diff)
+        state.jobid_info = jobid_info
+        return True, touched | set(deltas)
+
+    node_info = new_node_info(topology)
+    for jobid, job in jobid_info.items():
+        if job['state'] == 'RUNNING':
+            update_nodes(node_info, jobid, job, 1)
+    state.topology_key = key
+    state.node_info = node_info
+    state.jobid_info = jobid_info
+    return True, None
+
+
 def main():
     args = parse_args()
-    if args.timestep < 60:
-        raise ValueError("TimeStep needs to be >= 60s.")
+    if args.timestep < 1:
+        raise ValueError("TimeStep needs to be >= 1s.")
 
     users = []
     disp_sel_users = False
@@ -471,37 +715,128 @@ def main():
         users.extend(args.users)
         disp_sel_users = True
 
+    if args.history == True:
+        display_history(args.by, time.time() - parse_window(args.since))
+        return
+
+    backend = get_backend(args.backend, args.fixture)
+    offline = args.fixture != None
+    clusters = [c for c in args.clusters.split(',') if c != ""] if args.clusters != None else []
+
+    if args.collect == True:
+        if len(clusters) > 0:
+            raise ValueError("--collect publishes the local cluster only, it does not take -M.")
+        collect(backend, offline)
+        return
+
+    use_snapshot = args.no_snapshot == False and offline == False
+    state = ClusterState()
+    if len(clusters) > 0:
+        state = new_federation(clusters, args.backend, args.fixture, offline)
+
+    if args.wait != None:
+        sys.exit(wait_jobs(backend, offline, use_snapshot, state, parse_jobids(args.wait), args.until, args.timeout, args.timestep))
+
+    if args.serve == True:
+        serve_metrics(backend, offline, use_snapshot, state, args.port)
+        return
+
+    screen = Screen() if args.monitor == True else None
+    tracker = UsageTracker(swc.SWS_CONF['GPU_IDLE_UTIL'], swc.SWS_CONF['GPU_IDLE_SAMPLES'])
+    poller = AdaptivePoller(min(swc.SWS_CONF['POLL_MIN_INTERVAL'], args.timestep), args.timestep, swc.SWS_CONF['POLL_BACKOFF'])
+    budget = new_budget(offline)
+
+    writer = None
+    if args.format != None:
+        writer = RecordWriter(sys.stdout, args.format)
+
     flag = True
     while flag:
-        #subprocess.run(["clear"])
-        
-        m_data = subprocess.check_output(['sh','/opt/swsuite/src/swqueue.sh'], stderr=subprocess.STDOUT)
-        #m_data = subprocess.check_output(['sh','/home/dmu/swsuite/src/swqueue.sh'], stderr=subprocess.STDOUT)
-        # m_data = ""
-        # with open("scontrol_sample_data.txt", 'r') as f:
-        #     m_data = f.read()
-
-        m_data = reformat(m_data, divider='\\n')
-        m_data = [line.strip().split(" ") for line in m_data]
-        frames = split_frames(m_data)
-        node_info, jobid_info = process_frames(frames)
+        on_job = None
+        if writer != None:
+            writer.begin(time.time())
+            # a single run streams the jobs while they are parsed, -m only
+            # writes the ones that changed
+            if args.monitor == False and type(state) == ClusterState:
+                on_job = writer.job
+        notes = None
+        if type(state) == Federation:
+            changed, touched = state.refresh()
+            notes = state.status_lines()
+        else:
+            changed, touched = load_cluster_state(backend, offline, use_snapshot, state, budget, on_job)
+        node_info, jobid_info = state.node_info, state.jobid_info
+
+        flag = args.monitor
+        if writer != None:
+            if changed == True:
+                if notes != None:
+                    for m in state.members:
+                        writer.cluster(m.cluster, m.error)
+                writer.write_changes(node_info, jobid_info, touched)
+            if flag == True:
+                time.sleep(poller.next_interval(changed))
+            continue
+
+        if changed == False and args.idle == False:
+            # nothing changed since the last refresh, only turn the page
+            if args.show == True and screen != None and screen.pages > 1:
+                display(False, jobid_info, node_info, allowed_users=users, display_select_users=disp_sel_users, screen=screen, touched=set(), notes=notes)
+            time.sleep(poller.next_interval(False))
+            continue
+
+        if len(jobid_info) == 0:
+            for line in notes or []:
+                print(line)
+            print("|")
+            print("|    NO JOB RUNNING...")
+            print("|")
+            exit()
 
         if args.show == True:
-            display(False, jobid_info, node_info, allowed_users=users, display_select_users=disp_sel_users)
+            display(False, jobid_info, node_info, allowed_users=users, display_select_users=disp_sel_users, screen=screen, touched=touched, notes=notes)
+        elif notes != None:
+            for line in notes:
+                print(line)
 
         nodes = []
         if type(args.nodev) == type(nodes):
             nodes.extend(args.nodev)
-            display_full_nodes(node_info, nodes_to_display=nodes)
+            display_full_nodes(node_info, state.store, nodes_to_display=nodes)
 
         users_for_fp = []
         if type(args.fpuser) == type(users_for_fp):
             users_for_fp.extend(args.fpuser)
-            display_full_user(jobid_info, users_to_display=users_for_fp)
+            display_full_user(state.store, users_to_display=users_for_fp)
+
+        if args.summary == True:
+            display_summary(node_info, state.store.totals)
+
+        if args.estimate != None:
+            if type(state) == Federation:
+                # jobs only start on nodes of their own cluster
+                for m in state.members:
+                    if m.idle() == True:
+                        display_estimates(m.state.node_info, m.state.jobid_info, args.estimate, args.hours, args.node_type, m.cluster)
+            else:
+                display_estimates(node_info, jobid_info, args.estimate, args.hours, args.node_type)
+
+        if args.idle == True:
+            # a single run takes all the samples needed to flag idle jobs,
+            # the monitor takes one per refresh
+            samples = 1 if args.monitor == True else swc.SWS_CONF['GPU_IDLE_SAMPLES']
+            display_usage(node_info, jobid_info, tracker, samples, swc.SWS_CONF['USAGE_SAMPLE_INTERVAL'])
+
+        # other output was printed below the frame, draw the next one in full
+        if screen != None and (len(nodes) > 0 or len(users_for_fp) > 0 or args.summary == True or args.estimate != None or args.idle == True):
+            screen.invalidate()
 
-        flag = args.monitor
         if flag == True:
-            subprocess.run(["sleep", str(args.timestep)])
+            time.sleep(poller.next_interval(changed))
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    except BrokenPipeError:
+        # the reader of --format output went away
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
@@ -0,0 +1,290 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swregistry.py
+# version 1.0
+#
+
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+
+import swconfig as swc
+from swprivate import open_private, write_private
+
+# Index of the container images in HAL_CONTAINER_REGISTRY, so swrun -s and
+# swbatch --singularity find an image without walking the registry. The
+# index maps image names (without extension) to where they are and is
+# kept in CONTAINER_INDEX between runs. It is refreshed with one stat per
+# directory: only directories whose mtime changed are listed again, and
+# nothing below CONTAINER_SEARCH_DEPTH_LIMIT is ever read.
+#
+# HAL_CONTAINER_REGISTRY is a search path like PATH, e.g.
+# $HOME/containers:/projects/abc/containers:/opt/container/singularity,
+# earlier roots win. Every root has an index of its own and all roots are
+# searched at the same time; as soon as a root answers with an image and
+# all roots before it answered without one, the others are cancelled.
+
+INDEX_VERSION = 1
+
+class Image:
+    __slots__ = ('name', 'ext', 'path', 'depth', 'size', 'mtime')
+
+    def __init__(self, name, ext, path, depth, size, mtime):
+        self.name = name
+        self.ext = ext
+        self.path = path
+        self.depth = depth
+        self.size = size
+        self.mtime = mtime
+
+    def to_list(self):
+        return [self.name, self.ext, self.path, self.depth, self.size, self.mtime]
+
+
+class RegistryIndex:
+
+    def __init__(self, root, depth_limit, extensions):
+        self.root = root.rstrip(os.sep) or os.sep
+        self.depth_limit = depth_limit
+        self.extensions = list(extensions)
+        # directory -> [mtime, depth, names of the images in it]
+        self.dirs = {}
+        # image name -> [Image], an image name can be in several directories
+        self.images = {}
+        self.refreshed = 0
+        # threading.Event set when the search no longer needs this root
+        self.cancel = None
+
+    def cancelled(self):
+        return self.cancel != None and self.cancel.is_set()
+
+    # What the index was built for, an index of another registry, depth
+    # limit or extension list is thrown away
+    def key(self):
+        return [INDEX_VERSION, self.root, self.depth_limit, self.extensions]
+
+    def split_ext(self, filename):
+        for ext in self.extensions:
+            if filename.endswith(ext) and len(filename) > len(ext):
+                return filename[:-len(ext)], ext
+        return None, None
+
+    def drop_images(self, directory):
+        for name in self.dirs[directory][2]:
+            left = [img for img in self.images.get(name, []) if os.path.dirname(img.path) != directory]
+            if len(left) > 0:
+                self.images[name] = left
+            else:
+                self.images.pop(name, None)
+
+    # Drops a directory and everything indexed below it
+    def drop_dir(self, directory):
+        prefix = directory + os.sep
+        for d in [d for d in self.dirs if d == directory or d.startswith(prefix)]:
+            self.drop_images(d)
+            del self.dirs[d]
+
+    # Lists one directory: indexes its images and scans the subdirectories
+    # not indexed yet while depth is below the limit
+    def scan_dir(self, directory, depth):
+        if self.cancelled() == True:
+            return
+        try:
+            mtime = os.stat(directory).st_mtime
+            entries = list(os.scandir(directory))
+        except OSError:
+            if directory in self.dirs:
+                self.drop_dir(directory)
+            return
+        if directory in self.dirs:
+            self.drop_images(directory)
+        names = []
+        self.dirs[directory] = [mtime, depth, names]
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if depth < self.depth_limit and entry.path not in self.dirs:
+                        self.scan_dir(entry.path, depth + 1)
+                    continue
+                name, ext = self.split_ext(entry.name)
+                if name == None:
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            self.images.setdefault(name, []).append(Image(name, ext, entry.path, depth, st.st_size, st.st_mtime))
+            names.append(name)
+
+    # Brings the index up to date with one stat per indexed directory,
+    # returns False if it was cancelled on the way
+    def refresh(self):
+        if self.root not in self.dirs:
+            self.scan_dir(self.root, 0)
+        for directory in sorted(self.dirs, key=len):
+            if self.cancelled() == True:
+                return False
+            if directory not in self.dirs:
+                # dropped with its parent
+                continue
+            mtime, depth, names = self.dirs[directory]
+            try:
+                current = os.stat(directory).st_mtime
+            except OSError:
+                self.drop_dir(directory)
+                continue
+            if current != mtime:
+                # images or subdirectories were added, removed or renamed,
+                # removed subdirectories fail their own stat further on
+                self.scan_dir(directory, depth)
+        if self.cancelled() == True:
+            return False
+        self.refreshed = time.time()
+        return True
+
+    # The image called name closest to the registry root, extensions in
+    # the order of ALLOWED_CONTAINER_IMAGE_EXTENSIONS
+    def lookup(self, name):
+        images = self.images.get(name)
+        if images == None:
+            return None
+        return min(images, key=lambda img: (img.depth, self.extensions.index(img.ext), img.path))
+
+    def to_dict(self):
+        return {'key': self.key(), 'refreshed': self.refreshed,
+                'dirs': self.dirs, 'images': [img.to_list() for imgs in self.images.values() for img in imgs]}
+
+    @classmethod
+    def from_dict(cls, data, root, depth_limit, extensions):
+        index = cls(root, depth_limit, extensions)
+        if data.get('key') != index.key():
+            return index
+        index.refreshed = data['refreshed']
+        index.dirs = data['dirs']
+        for row in data['images']:
+            img = Image(*row)
+            index.images.setdefault(img.name, []).append(img)
+        return index
+
+
+# every root of the search path has an index of its own, in the private
+# directory of the user (see swprivate)
+def index_path(root):
+    digest = hashlib.md5(root.encode()).hexdigest()[:12]
+    return "{}.{}".format(swc.SWS_CONF['CONTAINER_INDEX'].format(os.getuid()), digest)
+
+def search_path(value):
+    return [root for root in value.split(':') if root != ""]
+
+# An index that is not a private file of the user is never read, an
+# empty one is refreshed from the registry instead
+def load_index(path, root, depth_limit, extensions):
+    try:
+        with os.fdopen(open_private(path), 'r') as f:
+            return RegistryIndex.from_dict(json.load(f), root, depth_limit, extensions)
+    except (OSError, ValueError, KeyError, TypeError):
+        return RegistryIndex(root, depth_limit, extensions)
+
+def save_index(path, index):
+    try:
+        write_private(path, json.dumps(index.to_dict(), separators=(',', ':')))
+    except OSError:
+        pass
+
+# Returns the Image of name under root, or None. A hit is checked to
+# still exist, a miss or an index older than CONTAINER_INDEX_TTL seconds
+# refreshes the index first. A cancelled search saves nothing.
+def find_in_root(name, root, depth_limit, extensions, cancel=None):
+    path = index_path(root)
+    index = load_index(path, root, depth_limit, extensions)
+    index.cancel = cancel
+
+    refreshed = False
+    age = time.time() - index.refreshed
+    if age < 0 or age > swc.SWS_CONF['CONTAINER_INDEX_TTL']:
+        if index.refresh() == False:
+            return None
+        refreshed = True
+    img = index.lookup(name)
+    if refreshed == False and (img == None or os.path.isfile(img.path) == False):
+        if index.refresh() == False:
+            return None
+        refreshed = True
+        img = index.lookup(name)
+
+    if refreshed == True:
+        save_index(path, index)
+    return img
+
+# Searches the roots in daemon threads, a hung filesystem must not keep
+# swrun from exiting
+def start_search(name, root, depth_limit, extensions, cancel):
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(find_in_root(name, root, depth_limit, extensions, cancel))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+# Returns the Image of name in the first root of the search path holding
+# it, or None
+def find_image(name, registry=None, depth_limit=None, extensions=None):
+    registry = registry if registry != None else swc.SWS_CONF['HAL_CONTAINER_REGISTRY']
+    depth_limit = depth_limit if depth_limit != None else swc.SWS_CONF['CONTAINER_SEARCH_DEPTH_LIMIT']
+    extensions = extensions if extensions != None else swc.SWS_CONF['ALLOWED_CONTAINER_IMAGE_EXTENSIONS']
+    roots = search_path(registry)
+    if len(roots) == 0:
+        # no registry configured
+        return None
+    if len(roots) == 1:
+        return find_in_root(name, roots[0], depth_limit, extensions)
+
+    cancel = threading.Event()
+    futures = [start_search(name, root, depth_limit, extensions, cancel) for root in roots]
+    try:
+        # in priority order, each wait only lasts until that root answered
+        for future in futures:
+            try:
+                img = future.result()
+            except OSError:
+                continue
+            if img != None:
+                return img
+        return None
+    finally:
+        cancel.set()
@@ -0,0 +1,95 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swscreen.py
+# version 1.0
+#
+
+import shutil
+import sys
+
+CLEAR = "\033[H\033[2J\033[3J"
+CLEAR_LINE = "\033[K"
+CLEAR_BELOW = "\033[J"
+
+def move_to(row):
+    return "\033[{};1H".format(row)
+
+# Terminal frame kept between refreshes of swqueue -m. The first frame is
+# drawn after clearing the screen, later frames only rewrite the lines that
+# changed, addressing them with the cursor instead of clearing everything.
+# When out is not a terminal frames are written as plain text one after
+# the other.
+class Screen:
+
+    def __init__(self, out=None):
+        self.out = out if out != None else sys.stdout
+        self.lines = None
+        # rendered rows of the previous frame, by node name
+        self.rows = {}
+        # what the cached rows were rendered for, see swqueue.display
+        self.geometry = None
+        # page shown by the next frame and number of pages of the last one
+        self.page = 0
+        self.pages = 1
+
+    def isatty(self):
+        try:
+            return self.out.isatty()
+        except (AttributeError, ValueError):
+            return False
+
+    # (columns, lines) of the terminal
+    def size(self):
+        return tuple(shutil.get_terminal_size((120, 40)))
+
+    # Forces the next frame to be drawn in full, e.g. after other output
+    # was printed below the frame
+    def invalidate(self):
+        self.lines = None
+        self.rows = {}
+
+    def draw(self, lines):
+        if self.isatty() == False:
+            buf = "\n".join(lines) + "\n"
+        elif self.lines == None:
+            buf = CLEAR + "\n".join(lines) + "\n"
+        else:
+            buf = ""
+            for i in range(len(lines)):
+                if i >= len(self.lines) or self.lines[i] != lines[i]:
+                    buf += move_to(i+1) + lines[i] + CLEAR_LINE
+            if len(lines) < len(self.lines):
+                buf += move_to(len(lines)+1) + CLEAR_BELOW
+            buf += move_to(len(lines)+1)
+        self.out.write(buf)
+        self.out.flush()
+        self.lines = lines
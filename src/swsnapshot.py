@@ -0,0 +1,194 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swsnapshot.py
+# version 1.0
+#
+
+import struct
+import mmap
+import json
+import zlib
+import time
+import stat
+import pwd
+import os
+
+from swhostlist import parse_hostlist
+
+# A snapshot is the node_info and jobid_info built by swqueue.process_frames,
+# published by one collector (swqueue --collect) so every other swqueue can
+# read it instead of querying slurm itself.
+#
+# File layout: a fixed header followed by the zlib compressed json payload
+#   magic, format version, generation, timestamp, payload size
+# The generation only changes when the payload changes, so a client that
+# already drew a generation can stop after reading the header. Files are
+# replaced atomically, readers never see a half written snapshot.
+#
+# The path is in a shared directory, so a snapshot is only trusted when it
+# is a regular file owned by the collector user (or root) and writable by
+# its owner alone; anything else is treated as no snapshot.
+
+MAGIC = b'SWQS'
+VERSION = 2
+HEADER = struct.Struct('<4sIQdQ')
+
+class Snapshot:
+    __slots__ = ('generation', 'timestamp', 'node_info', 'jobid_info')
+
+    def __init__(self, generation, timestamp, node_info, jobid_info):
+        self.generation = generation
+        self.timestamp = timestamp
+        self.node_info = node_info
+        self.jobid_info = jobid_info
+
+
+def encode(node_info, jobid_info):
+    jobs = {}
+    for jobid, v in jobid_info.items():
+        job = dict(v)
+        job['nodes'] = str(v['nodes'])
+        jobs[jobid] = job
+    data = json.dumps({'nodes': node_info, 'jobs': jobs}, separators=(',', ':'), sort_keys=True)
+    return zlib.compress(data.encode(), 6)
+
+def decode(payload):
+    data = json.loads(zlib.decompress(payload).decode())
+    node_info = data['nodes']
+    for v in node_info.values():
+        v['users_jobids'] = [tuple(x) for x in v['users_jobids']]
+    jobid_info = {}
+    for jobid, v in data['jobs'].items():
+        v['nodes'] = parse_hostlist(v['nodes'])
+        jobid_info[int(jobid)] = v
+    return node_info, jobid_info
+
+
+# uid of the collector user, given as a name or a uid. Unknown names only
+# trust root.
+def snapshot_owner(owner):
+    if type(owner) == int:
+        return owner
+    try:
+        return pwd.getpwnam(owner).pw_uid
+    except KeyError:
+        return 0
+
+def trusted(st, owner):
+    return stat.S_ISREG(st.st_mode) and st.st_uid in (owner, 0) and st.st_mode & 0o022 == 0
+
+# Opens the snapshot for reading if it can be trusted, None otherwise
+def open_snapshot(path, owner):
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return None
+    try:
+        if trusted(os.fstat(fd), owner) == False:
+            os.close(fd)
+            return None
+    except OSError:
+        os.close(fd)
+        return None
+    return os.fdopen(fd, 'rb')
+
+# Returns (generation, timestamp) of the snapshot or None if there is none
+# or it is not owned by owner (a uid)
+def read_header(path, owner):
+    f = open_snapshot(path, owner)
+    if f == None:
+        return None
+    try:
+        with f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, version, generation, timestamp, size = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return generation, timestamp
+
+def read_snapshot(path, owner):
+    f = open_snapshot(path, owner)
+    if f == None:
+        return None
+    try:
+        with f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                magic, version, generation, timestamp, size = HEADER.unpack_from(m, 0)
+                if magic != MAGIC or version != VERSION:
+                    return None
+                payload = m[HEADER.size:HEADER.size+size]
+    except (OSError, ValueError, struct.error):
+        return None
+    node_info, jobid_info = decode(payload)
+    return Snapshot(generation, timestamp, node_info, jobid_info)
+
+def write_snapshot(path, generation, timestamp, payload):
+    tmp = "{}.{}".format(path, os.getpid())
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o644)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, generation, timestamp, len(payload)))
+        f.write(payload)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+# True if a collector has published a snapshot recently enough to use it
+def is_fresh(header, max_age):
+    return header != None and time.time() - header[1] <= max_age
+
+
+# Publishing side, used by swqueue --collect. Only the collector user
+# (owner, a uid) may publish, readers would ignore anyone else's snapshot.
+class SnapshotWriter:
+
+    def __init__(self, path, owner):
+        if os.getuid() != owner:
+            raise PermissionError("swqueue --collect has to run as uid {}, not {}.".format(owner, os.getuid()))
+        self.path = path
+        header = read_header(path, owner)
+        self.generation = header[0] if header != None else 0
+        self.last_payload = None
+
+    # Publishes the state and returns the generation of the snapshot,
+    # unchanged states only refresh the timestamp
+    def publish(self, node_info, jobid_info):
+        payload = encode(node_info, jobid_info)
+        if payload != self.last_payload:
+            self.generation += 1
+            self.last_payload = payload
+        write_snapshot(self.path, self.generation, time.time(), payload)
+        return self.generation
@@ -0,0 +1,236 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swstage.py
+# version 1.0
+#
+
+import os
+import sys
+import time
+import json
+import shlex
+import hashlib
+import argparse
+import subprocess
+
+import swconfig as swc
+from swprivate import private_dir
+
+# Node-local copies of container images for batch jobs that ask for them
+# (#SBATCH --stage_container=yes). Instead of every rank reading the image
+# off the shared filesystem, the batch script runs `swstage.py stage`: the
+# nodes of the allocation report whether they already hold the image in
+# CONTAINER_STAGE_DIR, and only if one of them does not is it broadcast
+# once with sbcast. Copies are named after the sha256 the image has when
+# the job starts, so any job of the user running the same image reuses
+# them, and the least recently used copies are evicted to stay under
+# CONTAINER_STAGE_CAP bytes per node.
+#
+# Every user stages into a directory of their own (CONTAINER_STAGE_DIR
+# formatted with the uid), created 0700 and checked to be owned by the user
+# and closed to everyone else before anything in it is trusted.
+
+CHUNK = 1 << 22
+DIGESTS = "digests.json"
+PART = ".part"
+
+# sha256 of an image, cached in the private directory by path, size and
+# mtime so a multi-GB image is only read once per version
+def image_digest(path, directory):
+    st = os.stat(path)
+    cache_path = os.path.join(directory, DIGESTS)
+    key = "{}:{}:{}".format(path, st.st_size, int(st.st_mtime))
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if key in cache:
+        return cache[key]
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    # forget older versions of the same image
+    cache = {k: v for k, v in cache.items() if k.rsplit(':', 2)[0] != path}
+    cache[key] = h.hexdigest()
+    tmp = "{}.{}".format(cache_path, os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, cache_path)
+    except OSError:
+        pass
+    return cache[key]
+
+# Name of the local copy of an image
+def staged_name(digest, path):
+    return digest + os.path.splitext(path)[1]
+
+# Deletes the least recently used copies in directory until need more
+# bytes fit under cap, never the copy called keep nor the broadcasts of
+# other jobs younger than CONTAINER_STAGE_PART_AGE seconds
+def evict(directory, cap, need, keep):
+    now = time.time()
+    copies = []
+    for entry in os.scandir(directory):
+        if entry.is_file(follow_symlinks=False) == False or entry.name in (keep, DIGESTS):
+            continue
+        st = entry.stat(follow_symlinks=False)
+        if entry.name.endswith(PART) and now - st.st_mtime < swc.SWS_CONF['CONTAINER_STAGE_PART_AGE']:
+            continue
+        copies.append((st.st_mtime, st.st_size, entry.path))
+    used = sum(size for mtime, size, path in copies)
+    for mtime, size, path in sorted(copies):
+        if used + need <= cap:
+            break
+        try:
+            os.remove(path)
+            used -= size
+        except OSError:
+            pass
+
+# Runs on every node: marks the copy as used if it is there and complete,
+# otherwise makes room for it. Prints "present", "missing" or "failed".
+def prepare(directory, name, size, cap):
+    try:
+        private_dir(directory)
+    except OSError:
+        return "failed"
+    path = os.path.join(directory, name)
+    try:
+        if os.path.getsize(path) == size:
+            os.utime(path)
+            return "present"
+    except OSError:
+        pass
+    evict(directory, cap, size, name)
+    return "missing"
+
+# Runs on every node after the broadcast: the copy is renamed into place
+# unless a complete one appeared meanwhile, jobs already running off the
+# old file keep reading it
+def install(directory, name, size, part):
+    try:
+        private_dir(directory)
+    except OSError:
+        return "failed"
+    path = os.path.join(directory, name)
+    part = os.path.join(directory, part)
+    try:
+        if os.path.getsize(path) == size:
+            os.remove(part)
+            return "present"
+    except OSError:
+        pass
+    try:
+        if os.path.getsize(part) != size:
+            return "failed"
+        os.replace(part, path)
+    except OSError:
+        return "failed"
+    return "installed"
+
+# Runs once in the batch script and prints the path the job should use:
+# the local copy, or the shared image if staging failed. The digest is
+# taken here, at job start, and the broadcast is only used if the image
+# did not change while it was being copied.
+def stage(image, directory, cap):
+
+    # one task per node of the allocation
+    def on_nodes(*args):
+        result = subprocess.run(['srun', '--nodes={}'.format(os.environ.get('SLURM_JOB_NUM_NODES', "1")),
+                                 '--ntasks-per-node=1', sys.executable, os.path.abspath(__file__)] + list(args),
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        return result.stdout.split()
+
+    try:
+        before = os.stat(image)
+        name = staged_name(image_digest(image, private_dir(directory)), image)
+        size = before.st_size
+        part = "{}.{}{}".format(name, os.environ.get('SLURM_JOB_ID', os.getpid()), PART)
+
+        states = on_nodes('prepare', directory, name, str(size), str(cap))
+        if len(states) == 0 or 'failed' in states:
+            return image
+        if 'missing' in states:
+            subprocess.run(['sbcast', '--force', image, os.path.join(directory, part)], check=True)
+            after = os.stat(image)
+            if (after.st_size, after.st_mtime) != (before.st_size, before.st_mtime):
+                # the copies may not match the digest, the parts age out
+                return image
+            if 'failed' in on_nodes('install', directory, name, str(size), part):
+                return image
+    except (OSError, subprocess.CalledProcessError):
+        return image
+    return os.path.join(directory, name)
+
+# Lines of the batch script staging image, they leave its local path in
+# $SWS_IMAGE, to be used quoted. Every path is quoted for the shell.
+def stage_commands(image):
+    return ["SWS_IMAGE=$({} {} stage {} {} {})".format(
+        "python3", shlex.quote(os.path.abspath(__file__)), shlex.quote(image),
+        shlex.quote(swc.SWS_CONF['CONTAINER_STAGE_DIR'].format(os.getuid())),
+        shlex.quote(str(swc.SWS_CONF['CONTAINER_STAGE_CAP'])))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage container images to node-local scratch.")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("stage", help="Broadcast IMAGE to the nodes of the allocation unless they hold it, print its local path.")
+    p.add_argument("image")
+    p.add_argument("directory")
+    p.add_argument("cap", type=int)
+    p = sub.add_parser("prepare", help="Check or make room for a copy on this node.")
+    p.add_argument("directory")
+    p.add_argument("name")
+    p.add_argument("size", type=int)
+    p.add_argument("cap", type=int)
+    p = sub.add_parser("install", help="Move a broadcast copy into place on this node.")
+    p.add_argument("directory")
+    p.add_argument("name")
+    p.add_argument("size", type=int)
+    p.add_argument("part")
+    args = parser.parse_args()
+
+    if args.command == "stage":
+        print(stage(args.image, args.directory, args.cap))
+    elif args.command == "prepare":
+        print(prepare(args.directory, args.name, args.size, args.cap))
+    elif args.command == "install":
+        print(install(args.directory, args.name, args.size, args.part))
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
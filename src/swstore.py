@@ -0,0 +1,136 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swstore.py
+# version 1.0
+#
+
+from swagg import JobTotals
+
+# The jobs of swqueue with secondary indexes by user, node, partition and
+# state. Each index maps a key to the set of jobids with that key, so a
+# lookup costs the size of the answer and not the size of the queue.
+# Between refreshes only the jobs of a diff are re-indexed, the same goes
+# for the cluster wide totals of swagg.
+
+INDEXES = ('user', 'node', 'partition', 'state')
+
+# Index keys of a jobid_info entry
+def job_keys(job):
+    return {'user': job['users'][:1],
+            'node': job['nodes'],
+            'partition': [job.get('partition', "")],
+            'state': [job['state']]}
+
+
+class JobStore:
+
+    def __init__(self, jobs=None):
+        self.jobs = {}
+        self.index = {name: {} for name in INDEXES}
+        self.totals = JobTotals()
+        if jobs != None:
+            self.load(jobs)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __contains__(self, jobid):
+        return jobid in self.jobs
+
+    def __getitem__(self, jobid):
+        return self.jobs[jobid]
+
+    def add(self, jobid, job):
+        if jobid in self.jobs:
+            self.remove(jobid)
+        self.jobs[jobid] = job
+        self.totals.add_job(jobid, job)
+        self.index_job(jobid, job)
+
+    def index_job(self, jobid, job):
+        for name, keys in job_keys(job).items():
+            index = self.index[name]
+            for key in keys:
+                index.setdefault(key, set()).add(jobid)
+
+    def remove(self, jobid):
+        job = self.jobs.pop(jobid)
+        self.totals.remove_job(jobid)
+        for name, keys in job_keys(job).items():
+            index = self.index[name]
+            for key in keys:
+                ids = index.get(key)
+                if ids != None:
+                    ids.discard(jobid)
+                    if len(ids) == 0:
+                        del index[key]
+
+    # Replaces the whole content, the totals in one columnar pass
+    def load(self, jobs):
+        self.jobs = dict(jobs)
+        self.index = {name: {} for name in INDEXES}
+        self.totals = JobTotals()
+        self.totals.load(jobs)
+        for jobid, job in jobs.items():
+            self.index_job(jobid, job)
+
+    # Brings the store to new_jobs re-indexing only the jobs of diff, as
+    # returned by swqueue.diff_jobs
+    def apply(self, new_jobs, diff):
+        for jobid in diff['removed']:
+            self.remove(jobid)
+        for jobid in diff['added'] + diff['changed']:
+            self.add(jobid, new_jobs[jobid])
+
+    # Jobids matching all given filters, each filter being a single key or
+    # a collection of keys, e.g. select(user=['alice','bob'], state='RUNNING')
+    def select(self, **filters):
+        result = None
+        for name, keys in filters.items():
+            if keys == None:
+                continue
+            if type(keys) == str:
+                keys = [keys]
+            index = self.index[name]
+            ids = set()
+            for key in keys:
+                ids |= index.get(key, set())
+            result = ids if result == None else result & ids
+            if len(result) == 0:
+                break
+        if result == None:
+            result = set(self.jobs)
+        return sorted(result)
+
+    # Number of jobs per key of an index, e.g. counts('state')
+    def counts(self, name):
+        return {key: len(ids) for key, ids in self.index[name].items()}
@@ -0,0 +1,107 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swtime.py
+# version 1.0
+#
+
+import time
+from functools import lru_cache
+
+# Slurm times, parsed once into integers. Thousands of jobs share the same
+# submit minute and time limit, so the parsers are memoized and a repeated
+# value costs a dictionary lookup.
+
+# Durations slurm prints or accepts for unlimited or unset time limits
+UNLIMITED = ('UNLIMITED', 'INFINITE', 'Partition_Limit', 'NONE', 'N/A', '(null)', '')
+
+# Seconds of a slurm duration: minutes, minutes:seconds,
+# hours:minutes:seconds, days-hours, days-hours:minutes or
+# days-hours:minutes:seconds. An int is a number of minutes, like the
+# time limits of squeue --json. None when unlimited or not a duration.
+@lru_cache(maxsize=4096)
+def parse_duration(value):
+    if type(value) == int:
+        return value * 60
+    value = value.strip()
+    if value in UNLIMITED:
+        return None
+    if '-' in value:
+        d, sep, value = value.partition('-')
+        parts = value.split(':')
+        units = [3600, 60, 1]
+    else:
+        d = '0'
+        parts = value.split(':')
+        units = [60] if len(parts) == 1 else [60, 1] if len(parts) == 2 else [3600, 60, 1]
+    if len(parts) > 3:
+        return None
+    try:
+        return int(d) * 86400 + sum(int(p) * u for p, u in zip(parts, units))
+    except ValueError:
+        return None
+
+# Seconds since the epoch of a slurm time stamp (2020-06-01T10:00:00, local
+# time), None for Unknown, None and the like
+@lru_cache(maxsize=65536)
+def parse_timestamp(value):
+    if type(value) == int:
+        return value if value > 0 else None
+    try:
+        return int(time.mktime(time.strptime(value, '%Y-%m-%dT%H:%M:%S')))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+# Seconds of a window given as 30m, 12h, 7d, 2w or a number of seconds
+def parse_window(text):
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7*86400}
+    text = text.strip()
+    if len(text) > 0 and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+# The slurm notation of a number of seconds, D-HH:MM:SS or HH:MM:SS
+def format_duration(seconds):
+    if seconds == None:
+        return "UNLIMITED"
+    seconds = int(seconds)
+    sign = "-" if seconds < 0 else ""
+    days, seconds = divmod(abs(seconds), 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days > 0:
+        return "{}{}-{:02d}:{:02d}:{:02d}".format(sign, days, hours, minutes, seconds)
+    return "{}{:02d}:{:02d}:{:02d}".format(sign, hours, minutes, seconds)
+
+def format_timestamp(t):
+    if t == None:
+        return "Unknown"
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t))
@@ -40,6 +40,10 @@ import argparse
 import math
 
 import swconfig as swc
+from swtime import parse_duration
+from swregistry import find_image
+from swstage import stage_commands
+from swlayout import job_layout, NODE_TYPES
 
 # Using collections for testing
 from collections import namedtuple
@@ -56,6 +60,18 @@ TEST_PASSED = OKGREEN + WHITE + "Test Passed!" + ENDC + ENDC
 TEST_FAILED = FAIL + WHITE + "Test Failed!" + ENDC + ENDC
 TEST_DIVIDER = '-'*28
 
+# swrun and swbatch take the walltime in hours: a bare number is a number
+# of hours, anything else is read in the slurm time format and rounded up
+# to whole hours
+def walltime_hours(value):
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    seconds = parse_duration(value)
+    if seconds == None:
+        raise ValueError("Invalid time {}, use a number of hours or the slurm format [D-]HH:MM:SS.".format(value))
+    return math.ceil(seconds / 3600)
+
 # Class to build scripts and commands
 
 class Builder:
@@ -125,25 +141,10 @@ class Builder:
         err_msg = ""
         err_code = 0
 
-        ftree = {}
-        depth = 0
-        for dirpath, dirnames, filenames, dirfd in os.fwalk(swc.SWS_CONF['HAL_CONTAINER_REGISTRY']):
-            ftree[depth] = {'directory':dirpath, 'files':filenames}
-            depth += 1
-
         final_img = ""
-        found = False
-        for k, v in ftree.items():
-            if k <= swc.SWS_CONF['CONTAINER_SEARCH_DEPTH_LIMIT']:
-                for ext in swc.SWS_CONF['ALLOWED_CONTAINER_IMAGE_EXTENSIONS']:
-                    container = container_noext + ext
-                    if container in v['files']:
-                        final_img = "{}/{}".format(v['directory'], container)
-                        found = True
-                    if found == True:
-                        break
-            if found == True:
-                break
+        img = find_image(container_noext)
+        if img != None:
+            final_img = img.path
 
         if final_img == "":
             flag = False
@@ -198,12 +199,8 @@ class Builder:
         job_parameters["cores-per-socket"] = swc.SWS_CONF['CORES_PER_SOCKET']
         job_parameters["threads-per-core"] = swc.SWS_CONF['THREADS_PER_CORE']
         job_parameters["gpus"] = swc.SWS_CONF['GPUS']
-        if uparams["node_type"] == "ppc64le":
-            job_parameters["mem-per-cpu"] = swc.SWS_CONF['NODE_DEFINE'][0]['mem_cpu']
-        if uparams["node_type"] == "arm":
-            job_parameters["mem-per-cpu"] = swc.SWS_CONF['NODE_DEFINE'][1]['mem_cpu']
-        if uparams["node_type"] == "x86":
-            job_parameters["mem-per-cpu"] = swc.SWS_CONF['NODE_DEFINE'][2]['mem_cpu']
+        if uparams["node_type"] in NODE_TYPES:
+            job_parameters["mem-per-cpu"] = NODE_TYPES[uparams["node_type"]]['mem_cpu']
 
         if mode == swc.SWS_CONF['INTERACTIVE_MODE']:
             job_parameters["wait"] = 0
@@ -223,65 +220,13 @@ class Builder:
         for item in to_del:
             del job_parameters[item]
 
-        cpu_flag = 1
-        multiplier = swc.SWS_CONF['MULTIPLIER']
-
-        partition = job_parameters["partition"]
-        q_num = int(partition.split('x')[1]) if "gpu" in partition else 0
-
-        if q_num >= 1 and q_num<=4:
-            multiplier = q_num
-            if job_parameters["node_type"] == "ppc64le":
-                job_parameters["partition"] = "gpu"
-            if job_parameters["node_type"] == "arm":
-                job_parameters["partition"] = "arm"
-            if job_parameters["node_type"] == "x86":
-                job_parameters["partition"] = "x86"                                
-        elif q_num >=8 and q_num <= 16:
-            multiplier = 4
-            job_parameters["nodes"] = q_num // 4
-            if job_parameters["node_type"] == "ppc64le":
-                job_parameters["partition"] = "gpu"
-            if job_parameters["node_type"] == "arm":
-                job_parameters["partition"] = "arm"
-            if job_parameters["node_type"] == "x86":
-                job_parameters["partition"] = "x86"      
-        else:
-            # cpu job
-            cpu_flag = 0
-            multiplier = 4
-            c_num = int(partition.split('n')[1]) if "cpun" in partition else 0
-            if c_num > 0:
-                job_parameters["partition"] = "cpu"
-            job_parameters["nodes"] = c_num
-            if job_parameters["node_type"] == "arm":
-                c_num = int(partition.split('n')[1]) if "cpux" in partition else 0
-                job_parameters["partition"] = "arm"
-                job_parameters["nodes"] = 1
-            if job_parameters["node_type"] == "x86":
-                c_num = int(partition.split('n')[1]) if "cpux" in partition else 0
-                job_parameters["partition"] = "x86"
-                job_parameters["nodes"] = 1
-
-        if job_parameters["node_type"] == "ppc64le":
-            gpu_type = swc.SWS_CONF['NODE_DEFINE'][0]['gpu_type']
-        if job_parameters["node_type"] == "arm":
-            gpu_type = swc.SWS_CONF['NODE_DEFINE'][1]['gpu_type']
-        if job_parameters["node_type"] == "x86":
-            gpu_type = swc.SWS_CONF['NODE_DEFINE'][2]['gpu_type']
-
-        job_parameters["gres"] = "gpu:{}:{}".format(gpu_type,job_parameters.pop("gpus")*multiplier*cpu_flag)
-
-        job_parameters["sockets-per-node"] = 2 if multiplier > 2 else 1
-
-        cpg = job_parameters.pop("cpu_per_gpu")
-
-        if cpu_flag == 1:
-            job_parameters["cores-per-socket"] = math.ceil(cpg / job_parameters["threads-per-core"] * multiplier / job_parameters["sockets-per-node"])
-            job_parameters["ntasks-per-node"] = job_parameters["cores-per-socket"]*job_parameters["sockets-per-node"]*job_parameters["threads-per-core"]
-        elif cpu_flag == 0:
-            job_parameters["cores-per-socket"] = 1
-            job_parameters["ntasks-per-node"] = 1
+        # partition, nodes, sockets, cores and gres come from the
+        # precompiled layout table, see swlayout.py
+        layout = job_layout(job_parameters["node_type"], job_parameters["partition"], job_parameters.pop("cpu_per_gpu"))
+        for k in ["partition", "nodes", "ntasks-per-node", "sockets-per-node", "cores-per-socket"]:
+            job_parameters[k] = layout[k]
+        job_parameters.pop("gpus")
+        job_parameters["gres"] = layout["gres"]
 
         hrs = job_parameters["time"]
 
@@ -333,29 +278,54 @@ class Builder:
 
         return script_buffer
 
-    # create the exec command for the container
-    def get_container_exec_command(self, command_dict, mode):
+    # create the exec command for the container, with stage the image is
+    # first copied to the nodes and used from there. Scripts of multi-node
+    # jobs launch the container on every node with srun, an interactive
+    # shell runs on the first node.
+    def get_container_exec_command(self, command_dict, mode, stage=False):
         command = ""
         img = ""
         gpu_flag = ""
 
         if "singularity" in command_dict:
             img = command_dict.pop("singularity")
-            if command_dict['nodes'] == 1:
-                gpu_flag = " --nv" if 'gpu' in command_dict['partition'] else ""
-            else:
-                raise TypeError("{}Running a container interactively only works on one node now!{}".format(FAIL, ENDC))
+            gpus = int(command_dict['gres'].split(':')[-1]) if 'gres' in command_dict else 0
+            gpu_flag = " --nv" if gpus > 0 else ""
             command = "\nmodule load singularity"
+            if stage == True:
+                for line in stage_commands(img):
+                    command += "\n{}".format(line)
+                img = '"$SWS_IMAGE"'
+            if command_dict['nodes'] > 1:
+                launcher = self.get_mpi_launcher(command_dict, gpus)
+                if mode == "exec":
+                    command += "\n{} {} {}{} {}".format(launcher, "singularity", mode, gpu_flag, img)
+                    return command
+                command += "\n# on all nodes: {} singularity exec{} {} COMMAND".format(launcher, gpu_flag, img)
             command += "\n{} {}{} {}".format("singularity", mode, gpu_flag, img)
 
         return command
 
+    # srun starting the ranks of a multi-node container job, one per gpu
+    # (one per task for cpu jobs) on every node. Each rank gets its own gpu,
+    # the cpus closest to it and the environment of the job; the container
+    # ranks wire up with the host MPI through CONTAINER_MPI.
+    def get_mpi_launcher(self, command_dict, gpus):
+        ranks = gpus if gpus > 0 else command_dict['ntasks-per-node']
+        launcher = "{} --nodes={} --ntasks-per-node={} --cpus-per-task={} --mpi={} --export=ALL".format(
+            swc.SWS_CONF['SLURM_RUN'], command_dict['nodes'], ranks, max(command_dict['ntasks-per-node'] // ranks, 1),
+            swc.SWS_CONF['CONTAINER_MPI'])
+        if gpus > 0:
+            launcher += " --gpus-per-task=1 --gpu-bind={}".format(swc.SWS_CONF['CONTAINER_GPU_BIND'])
+        return launcher
+
     # Takes a dictionary and resolves certain values if they are environment variables
     def resolve_env_vars(self, conf):
         for k, v in conf.items():
             if type(v) == str:
-                if v[0] == "$":
-                    conf[k] = os.environ[v[1:]]
+                if v.startswith("$"):
+                    # unset variables resolve to "", e.g. no container registry
+                    conf[k] = os.environ.get(v[1:], "")
 
         return
 
@@ -392,15 +362,7 @@ class Builder:
         uparams["node_type"] = swc.SWS_CONF['NODE_TYPE_DEFAULT']
         # print(swc.SWS_CONF['NODE_DEFINE'][0]['gpu_type'])
 
-        wtf = args.time[0]
-        try:
-            hh, mm, ss = wtf.split(':')
-            hrs = int(hh)
-            if int(mm) > 0:
-                hrs = hrs + 1
-        except ValueError:
-            hrs = int(wtf)
-        uparams["time"] = int(hrs)           
+        uparams["time"] = walltime_hours(args.time[0])
 
         if "node_type" in args:
             uparams["node_type"] = args.node_type[0]
@@ -458,16 +420,12 @@ class Builder:
                 p = sc[1].split(" ")[1].split("=")
                 key = p[0].split("--")[1]
                 if key == "time":
-                    try:
-                        hh, mm, ss = p[1].split(':')
-                        hrs = int(hh)
-                        if int(mm) > 0:
-                            hrs = hrs + 1
-                    except ValueError:
-                        hrs = int(p[1])
-                    uparams[key] = int(hrs)
+                    uparams[key] = walltime_hours(p[1])
+                else:
+                    uparams[key] = int(p[1]) if p[1].isdigit() else p[1]
 
-                uparams[key] = int(p[1]) if p[1].isdigit() else p[1]
+        # #SBATCH --stage_container=yes copies the image to the nodes first
+        stage = str(uparams.pop("stage_container", swc.SWS_CONF['CONTAINER_STAGE'])).lower() in ["1", "yes", "true"]
 
         if "partition" not in uparams:
             raise ValueError("Need Partition!")
@@ -482,15 +440,24 @@ class Builder:
         command_dict = self.build_command_internal(self._job_parameters)
 
         # Inserting container execution command at the start of script, after SBATCH commands
-        singularity_command = self.get_container_exec_command(command_dict, "exec")
+        singularity_command = self.get_container_exec_command(command_dict, "exec", stage)
+        setup_commands = [singularity_command]
         if len(singularity_command) > 0:
-            sing_exec_command = singularity_command.split("\n")[2]
-            singularity_command = singularity_command.split("\n")[1]
-            for i in range(len(scommands)):
-                if scommands[i][0] == swc.SWS_CONF['NON_BATCH_COMMAND']:
-                    scommands[i] = (scommands[i][0], sing_exec_command + " " + scommands[i][1])
-
-        scommands.insert(0, (swc.SWS_CONF['NON_BATCH_COMMAND'], singularity_command))
+            # the module load and staging lines, then the exec prefix
+            setup_commands = singularity_command.split("\n")[1:-1]
+            sing_exec_command = singularity_command.split("\n")[-1]
+            to_wrap = [i for i in range(len(scommands)) if scommands[i][0] == swc.SWS_CONF['NON_BATCH_COMMAND']]
+            if command_dict['nodes'] > 1:
+                # multi-node jobs start one srun step: the lines after a
+                # CONTAINER_LAUNCH_MARK comment, or the last command. The other
+                # lines (cd, export, downloads) run once on the first node.
+                marked = [i for i in to_wrap if i > 0 and scommands[i-1] == (swc.SWS_CONF['COMMENT'], swc.SWS_CONF['CONTAINER_LAUNCH_MARK'])]
+                to_wrap = marked if len(marked) > 0 else to_wrap[-1:]
+            for i in to_wrap:
+                scommands[i] = (scommands[i][0], sing_exec_command + " " + scommands[i][1])
+
+        for i, comm in enumerate(setup_commands):
+            scommands.insert(i, (swc.SWS_CONF['NON_BATCH_COMMAND'], comm))
 
         script_buffer = self.command_dict_to_script(command_dict, scommands)
 
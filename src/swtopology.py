@@ -0,0 +1,212 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swtopology.py
+# version 1.0
+#
+
+import subprocess
+import json
+import time
+import os
+
+import swconfig as swc
+from swhostlist import expand_hostlist
+from swbackend import cluster_command
+from swprivate import open_private, write_private
+
+# Inventory of the compute nodes used by swqueue: node type, cpu and gpu
+# capacity, partitions and state. It is read from scontrol show node and
+# its static fields are kept in a cache file for TOPOLOGY_CACHE_TTL
+# seconds. The state changes far more often (drains, reboots, failures),
+# so it is read at every call with a single sinfo call. Without
+# slurm the inventory falls back to NODE_HOSTLIST and the capacities in
+# NODE_DEFINE.
+
+ARCH_TO_NODE_TYPE = {'ppc64le': 'ppc64le', 'aarch64': 'arm', 'arm64': 'arm', 'x86_64': 'x86'}
+
+# Fields of a Node that go to the cache
+STATIC_FIELDS = ('name', 'node_type', 'tot_cpu', 'tot_gpu', 'gpu_type', 'partitions')
+
+class Node:
+    __slots__ = ('name', 'node_type', 'tot_cpu', 'tot_gpu', 'gpu_type', 'state', 'partitions')
+
+    def __init__(self, name, node_type, tot_cpu, tot_gpu, gpu_type="", state="unknown", partitions=""):
+        self.name = name
+        self.node_type = node_type
+        self.tot_cpu = tot_cpu
+        self.tot_gpu = tot_gpu
+        self.gpu_type = gpu_type
+        self.state = state
+        self.partitions = partitions
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in STATIC_FIELDS}
+
+    def __repr__(self):
+        return "Node({}, {}, cpus={}, gpus={}, {})".format(self.name, self.node_type, self.tot_cpu, self.tot_gpu, self.state)
+
+
+def node_define(node_type):
+    for nd in swc.SWS_CONF['NODE_DEFINE']:
+        if nd['node_type'] == node_type:
+            return nd
+    return node_define(swc.SWS_CONF['NODE_TYPE_DEFAULT'])
+
+# Node with the capacity of its type as given in NODE_DEFINE
+def default_node(name, node_type=None):
+    nd = node_define(node_type if node_type != None else swc.SWS_CONF['NODE_TYPE_DEFAULT'])
+    return Node(name, nd['node_type'], nd['tot_cpu'], nd['tot_gpu'], nd['gpu_type'])
+
+def default_nodes():
+    nodes = {}
+    for node_type, hostlist in swc.SWS_CONF['NODE_HOSTLIST'].items():
+        for name in expand_hostlist(hostlist):
+            nodes[name] = default_node(name, node_type)
+    return nodes
+
+
+# Takes a Gres value such as gpu:v100:4(S:0-1),nvme:1 and returns the
+# number and type of gpus
+def parse_gres(gres):
+    count = 0
+    gpu_type = ""
+    for item in gres.split(','):
+        fields = item.split('(')[0].split(':')
+        if fields[0] != 'gpu' or len(fields) < 2:
+            continue
+        if fields[-1].isdigit():
+            count += int(fields[-1])
+        if len(fields) == 3:
+            gpu_type = fields[1]
+    return count, gpu_type
+
+# Parses the output of scontrol show node --oneliner
+def parse_node_records(lines):
+    nodes = {}
+    for line in lines:
+        fields = {}
+        for token in line.split():
+            key, sep, value = token.partition('=')
+            if sep != "":
+                fields[key] = value
+        if 'NodeName' not in fields:
+            continue
+        node_type = ARCH_TO_NODE_TYPE.get(fields.get('Arch', ""), None)
+        node = default_node(fields['NodeName'], node_type)
+        if 'CPUTot' in fields:
+            node.tot_cpu = int(fields['CPUTot'])
+        if 'Gres' in fields:
+            node.tot_gpu, gpu_type = parse_gres(fields['Gres'])
+            if gpu_type != "":
+                node.gpu_type = gpu_type
+        node.state = fields.get('State', "unknown").lower()
+        node.partitions = fields.get('Partitions', "")
+        nodes[node.name] = node
+    return nodes
+
+def query_nodes(cluster=None):
+    output = subprocess.check_output(cluster_command(['scontrol', 'show', 'node', '--oneliner'], cluster),
+                                     universal_newlines=True)
+    return parse_node_records(output.split('\n'))
+
+# Parses the output of sinfo -h -N -o "%N %T", a node being listed once
+# per partition
+def parse_node_states(lines):
+    states = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) == 2:
+            states[fields[0]] = fields[1].lower()
+    return states
+
+def query_node_states(cluster=None):
+    output = subprocess.check_output(cluster_command(['sinfo', '-h', '-N', '-o', '%N %T'], cluster),
+                                     universal_newlines=True)
+    return parse_node_states(output.split('\n'))
+
+
+# every cluster of -M has a cache of its own, in the private directory of
+# the user
+def cache_path(cluster=None):
+    path = swc.SWS_CONF['TOPOLOGY_CACHE'].format(os.getuid())
+    return path if cluster == None else "{}.{}".format(path, cluster)
+
+# Only a private file of the user (see swprivate) is read as a cache
+def load_cache(path, ttl):
+    try:
+        with os.fdopen(open_private(path), 'r') as f:
+            age = time.time() - os.fstat(f.fileno()).st_mtime
+            if age < 0 or age > ttl:
+                return None
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    nodes = {}
+    # a cache of another layout is read again from slurm
+    for d in data:
+        try:
+            nodes[d['name']] = Node(**{k: d[k] for k in STATIC_FIELDS})
+        except (KeyError, TypeError):
+            return None
+    return nodes
+
+def save_cache(path, nodes):
+    try:
+        write_private(path, json.dumps([n.to_dict() for n in nodes.values()]))
+    except OSError:
+        pass
+
+# Returns the node inventory as an ordered dict of name -> Node
+def get_topology(offline=False, refresh=False, cluster=None):
+    if offline == True:
+        return default_nodes()
+
+    path = cache_path(cluster)
+    nodes = None if refresh == True else load_cache(path, swc.SWS_CONF['TOPOLOGY_CACHE_TTL'])
+    if nodes == None:
+        try:
+            nodes = query_nodes(cluster)
+        except (OSError, subprocess.CalledProcessError):
+            return default_nodes()
+        if len(nodes) == 0:
+            return default_nodes()
+        save_cache(path, nodes)
+
+    # the same state names whether the static fields came from the cache
+    # or not, scontrol is only the fallback
+    try:
+        states = query_node_states(cluster)
+    except (OSError, subprocess.CalledProcessError):
+        states = {}
+    for name, node in nodes.items():
+        node.state = states.get(name, node.state)
+    return nodes
@@ -0,0 +1,161 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swusage.py
+# version 1.0
+#
+
+from swjobs import alloc_masks
+
+# Allocated versus actual usage. Samples from swprobe.probe_node_usage are
+# joined to the gpus each job holds, jobs whose gpus all stay at or below
+# GPU_IDLE_UTIL percent for GPU_IDLE_SAMPLES samples in a row are flagged,
+# and the time the gpus of flagged jobs were held is summed up per user.
+# The load average is per node, so it is shown against the cpus allocated
+# on the job's nodes to all jobs, not against the cpus of the job alone.
+
+# Usage of one job over its nodes in the latest sample
+class JobUsage:
+    __slots__ = ('jobid', 'user', 'nodes', 'gpus', 'util', 'mem_used', 'load', 'node_cpus', 'idle_gpus', 'idle_samples')
+
+    def __init__(self, jobid, user, nodes):
+        self.jobid = jobid
+        self.user = user
+        self.nodes = nodes
+        self.gpus = 0
+        self.util = 0
+        self.mem_used = 0
+        # load average of the job's nodes and the cpus allocated on them
+        self.load = None
+        self.node_cpus = 0
+        self.idle_gpus = 0
+        self.idle_samples = 0
+
+
+# Returns {(node, jobid): [gpu indices]} of the running jobs, taken from
+# the GRES IDX of scontrol show job -d. Jobs without it are handed the
+# remaining gpus of the node in job order.
+def map_job_gpus(node_info, jobid_info):
+    job_gpus = {}
+    for node, v in node_info.items():
+        free = [i for i in range(v['tot_gpu']) if not (v['gpu_mask'] >> i) & 1]
+        for (jobid, user) in v['users_jobids']:
+            job = jobid_info[jobid]
+            gpu_mask = alloc_masks(job['alloc']).get(node, (0, 0))[1]
+            if gpu_mask != 0:
+                job_gpus[(node, jobid)] = [i for i in range(gpu_mask.bit_length()) if (gpu_mask >> i) & 1]
+            else:
+                count = job['gpus'] // max(len(job['nodes']), 1)
+                job_gpus[(node, jobid)] = free[:count]
+                free = free[count:]
+    return job_gpus
+
+
+class UsageTracker:
+
+    def __init__(self, idle_util, idle_samples):
+        self.idle_util = idle_util
+        self.idle_samples = idle_samples
+        # jobid -> number of samples in a row with all gpus idle
+        self.idle_counts = {}
+        # user -> seconds of gpu time held by idle gpus
+        self.wasted = {}
+        self.last_time = None
+
+    # Joins one round of node probes to the jobs and returns a JobUsage
+    # per gpu job
+    def add_sample(self, node_info, jobid_info, probes, now):
+        dt = now - self.last_time if self.last_time != None else 0
+        self.last_time = now
+
+        usage = {}
+        for (node, jobid), indices in map_job_gpus(node_info, jobid_info).items():
+            probe = probes.get(node)
+            if len(indices) == 0 or probe == None or probe.error != "":
+                continue
+            job = jobid_info[jobid]
+            if jobid not in usage:
+                usage[jobid] = JobUsage(jobid, job['users'][0], job['nodes'])
+            u = usage[jobid]
+            gpus = {g.index: g for g in probe.gpus}
+            for i in indices:
+                if i not in gpus:
+                    continue
+                u.gpus += 1
+                u.util += gpus[i].util
+                u.mem_used += gpus[i].mem_used
+                if gpus[i].util <= self.idle_util:
+                    u.idle_gpus += 1
+            if probe.load != None:
+                u.load = probe.load if u.load == None else u.load + probe.load
+                u.node_cpus += node_info[node]['cpus']
+
+        for jobid, u in usage.items():
+            if u.gpus > 0:
+                u.util = u.util // u.gpus
+            if u.gpus > 0 and u.idle_gpus == u.gpus:
+                self.idle_counts[jobid] = self.idle_counts.get(jobid, 0) + 1
+            else:
+                self.idle_counts[jobid] = 0
+            u.idle_samples = self.idle_counts[jobid]
+            if self.is_idle(u):
+                self.wasted[u.user] = self.wasted.get(u.user, 0) + u.gpus * dt
+
+        # forget jobs that ended
+        for jobid in list(self.idle_counts):
+            if jobid not in usage:
+                del self.idle_counts[jobid]
+
+        return sorted(usage.values(), key=lambda u: u.jobid)
+
+    def is_idle(self, u):
+        return u.idle_samples >= self.idle_samples
+
+    # Wasted gpu hours per user, largest first
+    def wasted_gpu_hours(self):
+        return sorted([(user, s / 3600.0) for user, s in self.wasted.items()], key=lambda x: -x[1])
+
+
+def format_usage(rows, tracker):
+    lines = ["{:>8} {:<10} {:<16} {:>4} {:>6} {:>9} {:>12}  {}".format(
+        "JOBID", "USER", "NODES", "GPUS", "UTIL", "MEM(MiB)", "LOAD/ALLOC", "")]
+    for u in rows:
+        load = "{:.1f}/{}".format(u.load, u.node_cpus) if u.load != None else "-"
+        flag = "IDLE for {} samples".format(u.idle_samples) if tracker.is_idle(u) else ""
+        lines.append("{:>8} {:<10} {:<16} {:>4} {:>5}% {:>9} {:>12}  {}".format(
+            u.jobid, u.user, str(u.nodes), u.gpus, u.util, u.mem_used, load, flag))
+
+    lines.append("")
+    lines.append("Wasted GPU-hours (jobs flagged idle, GPUs at <= {}% utilization for {} samples) by user:".format(
+        tracker.idle_util, tracker.idle_samples))
+    for user, hours in tracker.wasted_gpu_hours():
+        lines.append("  {:<10} {:8.2f}".format(user, hours))
+    return "\n".join(lines)
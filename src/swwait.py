@@ -0,0 +1,201 @@
+#Copyright (c) 2020 University of Illinois.  All rights reserved.
+#
+#Developed by: Innovative Systems Lab
+#              National Center for Supercomputing Applications
+#              http://www.ncsa.uiuc.edu/AboutUs/Directorates/ISL.html
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy of
+#this software and associated documentation files (the "Software"), to deal with
+#the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+#of the Software, and to permit persons to whom the Software is furnished to
+#do so, subject to the following conditions:
+#* Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimers.
+#* Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimers in the documentation
+#  and/or other materials provided with the distribution.
+#* Neither the names of Innovative Systems Lab, National Center for Supercomputing Applications,
+#  nor the names of its contributors may be used to endorse or promote products
+#  derived from this Software without specific prior written permission.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+#CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS WITH THE
+#SOFTWARE.
+
+#!/bin/python3
+#
+# /opt/apps/swsuite/src/swwait.py
+# version 1.0
+#
+
+import threading
+import time
+
+import swconfig as swc
+from swpoll import AdaptivePoller
+
+# Blocks until jobs reach a state, instead of loops of squeue -j and sleep.
+# All the watches of a process share one poll of the cluster state: one
+# query per interval for any number of jobs, read from the collector
+# snapshot when there is one. The interval backs off while none of the
+# watched jobs changes state.
+#
+#   waiter = new_waiter()
+#   states = waiter.wait([1001, 1002], targets=[RUNNING], timeout=3600)
+#
+# swqueue only keeps running and pending jobs, a job that left the queue
+# is ENDED whatever the reason, and it ends any wait. After max_failures
+# loads in a row fail the watches give up instead of waiting forever on a
+# queue that cannot be read.
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+ENDED = 'ENDED'
+STATES = [PENDING, RUNNING, ENDED]
+
+# The jobs of one waiter. callback(jobid, old, new) is called on every
+# state change, old is None the first time a job is seen.
+class Watch:
+
+    def __init__(self, jobids, targets, callback=None):
+        self.jobids = list(jobids)
+        self.targets = set(targets)
+        self.callback = callback
+        # jobid -> last state seen
+        self.states = {}
+        self.done = threading.Event()
+        # set when the waiter gave up on loading the queue
+        self.error = ""
+
+    # Takes the state of a refresh, returns whether a job changed state
+    def update(self, jobid_info):
+        changed = False
+        for jobid in self.jobids:
+            job = jobid_info.get(jobid)
+            state = job['state'] if job != None else ENDED
+            old = self.states.get(jobid)
+            if state == old:
+                continue
+            self.states[jobid] = state
+            changed = True
+            if self.callback != None:
+                self.callback(jobid, old, state)
+        if all(s in self.targets or s == ENDED for s in self.states.values()):
+            self.done.set()
+        return changed
+
+    def fail(self, error):
+        self.error = error
+        self.done.set()
+
+    # True once all jobs reached a target, False on timeout or failure
+    def wait(self, timeout=None):
+        return self.done.wait(timeout) and self.error == ""
+
+
+class JobWaiter:
+
+    # load() returns the jobid_info of a fresh refresh, on_error(error,
+    # failures) is called after every failed load
+    def __init__(self, load, poller, max_failures=None, on_error=None):
+        self.load = load
+        self.poller = poller
+        self.max_failures = max_failures
+        self.on_error = on_error
+        self.lock = threading.Lock()
+        self.watches = []
+        self.thread = None
+        # error of the last load, empty when it worked, and the number of
+        # loads in a row that failed
+        self.error = ""
+        self.failures = 0
+
+    # Adds a watch, polled from a background thread until it is done
+    def watch(self, jobids, targets=(ENDED,), callback=None):
+        w = Watch(jobids, targets, callback)
+        with self.lock:
+            self.watches.append(w)
+            # a new waiter should not sit out a backed off interval
+            self.poller.next_interval(True)
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return w
+
+    # Blocks until all jobids reached one of targets or timeout seconds
+    # passed, returns (done, {jobid: last state seen})
+    def wait(self, jobids, targets=(ENDED,), timeout=None, callback=None):
+        w = self.watch(jobids, targets, callback)
+        done = w.wait(timeout)
+        if done == False:
+            with self.lock:
+                if w in self.watches:
+                    self.watches.remove(w)
+        return done, dict(w.states)
+
+    # One refresh for all watches, returns whether a watched job changed
+    def poll(self):
+        with self.lock:
+            watches = list(self.watches)
+        try:
+            jobid_info = self.load()
+            self.error = ""
+            self.failures = 0
+        except Exception as e:
+            self.error = "{}: {}".format(type(e).__name__, e)
+            self.failures += 1
+            if self.on_error != None:
+                self.on_error(self.error, self.failures)
+            if self.max_failures != None and self.failures >= self.max_failures:
+                for w in watches:
+                    w.fail(self.error)
+            return False
+        changed = False
+        for w in watches:
+            if w.update(jobid_info) == True:
+                changed = True
+        return changed
+
+    def run(self):
+        while True:
+            with self.lock:
+                self.watches = [w for w in self.watches if w.done.is_set() == False]
+                if len(self.watches) == 0:
+                    self.thread = None
+                    return
+            changed = self.poll()
+            with self.lock:
+                interval = self.poller.next_interval(changed)
+            time.sleep(interval)
+
+
+# A waiter over the cluster state swqueue reads: the collector snapshot
+# when it is fresh, slurm under the query budget otherwise
+def new_waiter(max_interval=60, backend_name="scontrol", fixture=None):
+    # swqueue imports this module for --wait
+    from swqueue import ClusterState, load_cluster_state, new_budget
+    from swbackend import get_backend
+
+    backend = get_backend(backend_name, fixture)
+    offline = fixture != None
+    state = ClusterState()
+    budget = new_budget(offline)
+
+    def load():
+        load_cluster_state(backend, offline, offline == False, state, budget)
+        return state.jobid_info
+
+    return JobWaiter(load, new_poller(max_interval), swc.SWS_CONF['WAIT_MAX_FAILURES'])
+
+def new_poller(max_interval):
+    return AdaptivePoller(min(swc.SWS_CONF['POLL_MIN_INTERVAL'], max_interval), max_interval, swc.SWS_CONF['POLL_BACKOFF'])
+
+# Parses the jobids given to swqueue --wait, jobs of a multi-cluster view
+# are named cluster:jobid
+def parse_jobids(values):
+    return [int(v) if v.isdigit() else v for v in values]